@@ -1,16 +1,37 @@
 from __future__ import absolute_import, unicode_literals
 
+import logging
+import sys
+import threading
+import weakref
+from collections import namedtuple
+from timeit import default_timer
+
 import babel
-import babel.numbers
-import babel.plural
+import six
 
 from fluent.syntax import FluentParser
 from fluent.syntax.ast import Message, Term
+from six.moves import queue
 
 from .builtins import BUILTINS
+from .codegen import CodegenCompiler
+from .locales import get_babel_locale, get_plural_form
 from .prepare import Compiler
-from .resolver import ResolverEnvironment, CurrentEnvironment
-from .utils import ATTRIBUTE_SEPARATOR, TERM_SIGIL, ast_to_id, native_to_fluent
+from .resolver import NO_ARGS, Attribute, BaseResolver, EnvironmentPool, Literal, freeze_tree
+from .snapshot import read_snapshot, write_snapshot
+from .utils import ATTRIBUTE_SEPARATOR, TERM_SIGIL, FluentArgs, ast_to_id, entry_references, scan_entries
+
+logger = logging.getLogger(__name__)
+
+COMPILERS = {
+    'resolver': Compiler,
+    'codegen': CodegenCompiler,
+}
+
+PRECOMPILE_MODES = ['lazy', 'eager', 'background']
+
+CompileStats = namedtuple('CompileStats', ['count', 'time'])
 
 
 class FluentBundle(object):
@@ -24,70 +45,816 @@ class FluentBundle(object):
     external arguments, conditional logic in form of select expressions, traits
     which describe their grammatical features, and can use Fluent builtins.
     See the documentation of the Fluent syntax for more information.
+
+    Messages are compiled on first use, by default to a tree of resolver
+    nodes. Pass `compiler='codegen'` to compile them to generated Python
+    functions instead, which are faster to call. Pass `precompile='eager'`
+    to compile messages when they are added instead, or
+    `precompile='background'` to compile them in a separate thread.
+
+    Pass `keep_ast=False` to release the parsed syntax tree of each message
+    and term once it has been compiled, which saves memory when most messages
+    are used. Pass `lazy_parse=True` to only find the ids of messages and
+    terms in `add_messages`, and parse each of them on first use (including
+    `has_message`, which is False for messages with syntax errors).
+
+    Use `FluentBundle.overlay` to create a bundle that overrides some of the
+    messages of another one, and shares the rest with it.
+
+    Once messages have been added, a single `FluentBundle` can be used to
+    format messages from many threads at once. All state used while
+    formatting is local to each `format` call.
     """
 
-    def __init__(self, locales, functions=None, use_isolating=True):
+    def __init__(self, locales, functions=None, use_isolating=True, compiler='resolver',
+                 precompile='lazy', keep_ast=True, lazy_parse=False):
         self.locales = locales
         _functions = BUILTINS.copy()
         if functions:
             _functions.update(functions)
         self._functions = _functions
         self._use_isolating = use_isolating
+        # Parsed entries by id. With keep_ast=False, entries that have been
+        # compiled are replaced by the compiled Message or Term. With
+        # lazy_parse=True, entries that haven't been parsed yet are
+        # UnparsedEntry objects.
         self._messages_and_terms = {}
+        self._keep_ast = keep_ast
+        self._lazy_parse = lazy_parse
         self._compiled = {}
-        self._compiler = Compiler(use_isolating=use_isolating)
+        # Ids of entries that have been compiled
+        self._compiled_entries = set()
+        # Resolver trees loaded from a snapshot, that haven't been turned into
+        # compiled values yet.
+        self._snapshot_trees = {}
+        # Messages that compile to a constant string, which we can return
+        # without doing any work.
+        self._static_messages = {}
+        # References that were linked to a fallback, because their target
+        # didn't exist at the time.
+        self._fallback_links = []
+        self._environments = EnvironmentPool(self)
+        self._frozen = False
+        # Maps from an entry id to the ids of the entries that reference it,
+        # and to the ids of the entries it references, built when needed.
+        self._dependents = None
+        self._references = None
+        # For overlays, the bundle that entries not found here come from,
+        # whether we can use its compiled entries, and for each entry id
+        # looked up so far, whether it can use the base's compiled entry
+        # (False if it is, or depends on, entries added to the overlay).
+        self._base = None
+        self._share_compiled = False
+        self._shares_by_id = {}
+        # Bundles with the same messages but the other use_isolating setting,
+        # created by `overlay`.
+        self._isolating_variants = {}
+        # Objects whose _bundle_changed method is called with (bundle, added
+        # ids, removed ids) when messages or terms are added or removed. They
+        # are held weakly, so that listening doesn't keep them alive.
+        self._listeners = weakref.WeakSet()
+        try:
+            compiler_class = COMPILERS[compiler]
+        except KeyError:
+            raise ValueError("Unknown compiler: {0}".format(compiler))
+        self._compiler_name = compiler
+        self._compiler = compiler_class(use_isolating=use_isolating, context=self)
+        if precompile not in PRECOMPILE_MODES:
+            raise ValueError("Unknown precompile mode: {0}".format(precompile))
+        self._precompile = precompile
+        # Lists of ids for the background thread to compile. There is at
+        # most one thread per bundle, which exits when the queue is empty.
+        self._precompile_queue = queue.Queue()
+        self._precompile_lock = threading.Lock()
+        self._precompile_thread = None
+        self._compile_count = 0
+        self._compile_time = 0.0
+        # Tracks nested compiles in this thread, so that time is only counted
+        # once for them.
+        self._compiling = threading.local()
+        # Held while compiling entries and while removing compiled entries,
+        # so that an entry compiled from a message that has since been
+        # replaced is never stored after it was invalidated.
+        self._compile_lock = threading.RLock()
         self._babel_locale = self._get_babel_locale()
-        self._plural_form = babel.plural.to_python(self._babel_locale.plural_form)
+        self._plural_form = get_plural_form(self._babel_locale)
 
     def add_messages(self, source):
+        """
+        Adds the messages and terms in the FTL string `source`. Messages and
+        terms that already exist are not changed.
+        """
+        self._add_entries(self._parse_entries(source), replace=False)
+
+    def replace_messages(self, source):
+        """
+        Adds the messages and terms in the FTL string `source`, replacing
+        existing messages and terms with the same ids. Compiled messages that
+        use the replaced entries, directly or indirectly, are compiled again
+        when they are next used. Other compiled messages are kept.
+
+        `FluentMessage` objects returned by `get_message` before this is
+        called are not updated.
+        """
+        self._add_entries(self._parse_entries(source), replace=True)
+
+    def add_resource(self, resource):
+        """
+        Adds the messages and terms in a `fluent.syntax.ast.Resource`, like
+        `add_messages`. The resource is not modified, and can be added to
+        other bundles too.
+        """
+        self._add_entries(_resource_entries(resource), replace=False)
+
+    def _parse_entries(self, source):
+        # Returns a list of (id, entry) tuples for the messages and terms
+        # in `source`
+        if self._lazy_parse:
+            entries = []
+            last = {}
+            for full_id, start, end in scan_entries(source):
+                unparsed = UnparsedEntry(source, start, end)
+                if full_id in last:
+                    # Later definitions are used if the first one turns out
+                    # to have syntax errors, as the parser would have done.
+                    last[full_id].next = unparsed
+                else:
+                    entries.append((full_id, unparsed))
+                last[full_id] = unparsed
+            return entries
         parser = FluentParser()
-        resource = parser.parse(source)
+        return _resource_entries(parser.parse(source))
+
+    def _add_entries(self, entries, replace):
+        if self._frozen:
+            raise RuntimeError("Can't add messages to a frozen FluentBundle")
+        if replace and not self._keep_ast:
+            raise ValueError("Can't replace messages in a FluentBundle with keep_ast=False")
         # TODO - warn/error about duplicates
-        for item in resource.body:
-            if isinstance(item, (Message, Term)):
-                full_id = ast_to_id(item)
-                if full_id not in self._messages_and_terms:
-                    self._messages_and_terms[full_id] = item
+        added = []
+        replaced = []
+        seen = set()
+        for full_id, item in entries:
+            if full_id in seen:
+                continue
+            seen.add(full_id)
+            if full_id not in self._messages_and_terms:
+                added.append(full_id)
+            elif replace:
+                replaced.append(full_id)
+            else:
+                continue
+            self._messages_and_terms[full_id] = item
+        if not (added or replaced):
+            return
+        self._unlink_fallbacks()
+        if added:
+            self._notify_listeners(added, [])
+        self._update_references(added + replaced)
+        if self._base is not None:
+            # Entries in the overlay, and everything that uses them, can't
+            # use the base's compiled entries
+            invalidated = self._invalidate(added + replaced)
+            self._shares_by_id.clear()
+        else:
+            invalidated = self._invalidate(replaced)
+        to_compile = added + sorted(invalidated.difference(added))
+        if self._precompile == 'eager':
+            self._compile_entries(to_compile)
+        elif self._precompile == 'background':
+            with self._precompile_lock:
+                self._precompile_queue.put(to_compile)
+                if self._precompile_thread is None:
+                    thread = threading.Thread(target=self._precompile_worker,
+                                              name='fluent-precompile')
+                    thread.daemon = True
+                    self._precompile_thread = thread
+                    thread.start()
+
+    def _remove_entries(self, entry_ids):
+        """
+        Removes the messages and terms with the given ids. Compiled messages
+        that use them are compiled again when they are next used.
+        """
+        if self._frozen:
+            raise RuntimeError("Can't remove messages from a frozen FluentBundle")
+        if not self._keep_ast:
+            # Compiled entries don't record what they refer to, so we can't
+            # find the messages that used the removed ones.
+            raise ValueError("Can't remove messages from a FluentBundle with keep_ast=False")
+        entry_ids = [entry_id for entry_id in entry_ids if entry_id in self._messages_and_terms]
+        if not entry_ids:
+            return
+        self._invalidate(entry_ids)
+        for entry_id in entry_ids:
+            del self._messages_and_terms[entry_id]
+        self._update_references(entry_ids)
+        if self._base is not None:
+            # Entries that only depended on removed overrides can use the
+            # base's compiled entries again
+            self._shares_by_id.clear()
+        self._notify_listeners([], entry_ids)
+
+    def _add_listener(self, listener):
+        self._listeners.add(listener)
+
+    def _notify_listeners(self, added, removed):
+        for listener in list(self._listeners):
+            listener._bundle_changed(self, added, removed)
+
+    def _unlink_fallbacks(self):
+        # References to things that didn't exist may now find them
+        fallback_links, self._fallback_links = self._fallback_links, []
+        for reference in fallback_links:
+            reference.unlink()
+
+    @classmethod
+    def overlay(cls, base, functions=None, messages=None, use_isolating=None):
+        """
+        Returns a new `FluentBundle` that has all the messages and functions of
+        `base`, plus `functions` and the FTL source `messages`, which override
+        those of `base` with the same names.
+
+        The overlay shares parsed and compiled messages with `base`, and only
+        compiles the messages it overrides, and the messages that refer to
+        those. Add all messages to `base` before creating overlays of it.
+
+        If `use_isolating` is different from the setting of `base`, messages
+        are compiled again, but only once for all overlays of `base` that
+        use the same setting.
+        """
+        if not base._keep_ast:
+            raise ValueError("Can't create an overlay of a FluentBundle with keep_ast=False")
+        if use_isolating is None:
+            use_isolating = base._use_isolating
+        if use_isolating != base._use_isolating:
+            base = base._isolating_variant(use_isolating)
+        bundle = cls._create_overlay(base, use_isolating, share_compiled=True)
+        if functions:
+            bundle._functions.update(functions)
+        if messages is not None:
+            bundle.add_messages(messages)
+        return bundle
+
+    @classmethod
+    def _create_overlay(cls, base, use_isolating, share_compiled):
+        bundle = cls(base.locales, use_isolating=use_isolating, compiler=base._compiler_name)
+        bundle._functions = base._functions.copy()
+        bundle._base = base
+        bundle._share_compiled = share_compiled
+        return bundle
+
+    def _isolating_variant(self, use_isolating):
+        try:
+            return self._isolating_variants[use_isolating]
+        except KeyError:
+            variant = self._create_overlay(self, use_isolating, share_compiled=False)
+            return self._isolating_variants.setdefault(use_isolating, variant)
+
+    def _invalidate(self, entry_ids):
+        """
+        Removes the compiled values of `entry_ids`, and of all entries that
+        use them, so that they are compiled again when they are next used.
+        Returns the set of ids of those entries.
+        """
+        if not entry_ids:
+            return set()
+        with self._compile_lock:
+            if self._base is None and not self._compiled and not self._snapshot_trees:
+                # Nothing to do, and we can avoid building the reference graph
+                return set(entry_ids)
+            invalidated = self._transitive_dependents(entry_ids)
+            self._compiled_entries -= invalidated
+            for compiled in (self._compiled, self._snapshot_trees):
+                for full_id in list(compiled):
+                    if full_id.split(ATTRIBUTE_SEPARATOR, 1)[0] in invalidated:
+                        del compiled[full_id]
+                        self._static_messages.pop(full_id, None)
+        return invalidated
+
+    def _transitive_dependents(self, entry_ids):
+        """
+        Returns the set of `entry_ids` and the ids of all entries that refer
+        to them, directly or indirectly, in this bundle or its bases.
+        """
+        dependents_maps = []
+        bundle = self
+        while bundle is not None:
+            dependents_maps.append(bundle._get_dependents())
+            bundle = bundle._base
+        result = set()
+        todo = list(entry_ids)
+        while todo:
+            entry_id = todo.pop()
+            if entry_id in result:
+                continue
+            result.add(entry_id)
+            for dependents in dependents_maps:
+                todo.extend(dependents.get(entry_id, ()))
+        return result
+
+    def _get_dependents(self):
+        if self._dependents is None:
+            self._dependents = {}
+            self._references = {}
+            self._update_references(list(self._messages_and_terms))
+        return self._dependents
+
+    def _update_references(self, entry_ids):
+        # Updates the reference graph for entries that were added, replaced
+        # or removed, if it has been built. Entries that haven't been parsed
+        # yet can't have been compiled, so they are added to the graph when
+        # they are parsed.
+        if self._dependents is None:
+            return
+        for entry_id in entry_ids:
+            for ref_id in self._references.pop(entry_id, ()):
+                self._dependents[ref_id].discard(entry_id)
+            entry = self._messages_and_terms.get(entry_id)
+            if entry is not None and not isinstance(entry, UnparsedEntry):
+                self._add_references(entry_id, entry)
+
+    def _add_references(self, entry_id, entry):
+        references = entry_references(entry)
+        self._references[entry_id] = references
+        for ref_id in references:
+            self._dependents.setdefault(ref_id, set()).add(entry_id)
+
+    def _get_entry(self, entry_id):
+        try:
+            entry = self._messages_and_terms[entry_id]
+        except KeyError:
+            if self._base is None:
+                raise
+            return self._base._get_entry(entry_id)
+        if isinstance(entry, UnparsedEntry):
+            # Overlays parse entries of their base while holding their own
+            # lock, so we need to take ours.
+            with self._compile_lock:
+                entry = self._messages_and_terms.get(entry_id)
+                if entry is None:
+                    # Removed while we waited
+                    return self._get_entry(entry_id)
+                if isinstance(entry, UnparsedEntry):
+                    entry = self._parse_entry(entry_id, entry)
+        return entry
+
+    def _parse_entry(self, entry_id, unparsed):
+        parser = FluentParser(with_spans=False)
+        entry = parser.parse_entry(unparsed.text())
+        while not isinstance(entry, (Message, Term)) or ast_to_id(entry) != entry_id:
+            unparsed = unparsed.next
+            if unparsed is None:
+                # A syntax error, which we only find now. The entry is treated
+                # as if it was never added, as the parser would have done.
+                if self._messages_and_terms.pop(entry_id, None) is not None:
+                    self._notify_listeners([], [entry_id])
+                raise KeyError(entry_id)
+            entry = parser.parse_entry(unparsed.text())
+        self._messages_and_terms[entry_id] = entry
+        if self._dependents is not None:
+            self._add_references(entry_id, entry)
+        return entry
+
+    def _entry_ids(self):
+        if self._base is None:
+            return list(self._messages_and_terms)
+        return list(set(self._messages_and_terms).union(self._base._entry_ids()))
+
+    def _shares_entry(self, entry_id):
+        if not self._share_compiled:
+            return False
+        try:
+            return self._shares_by_id[entry_id]
+        except KeyError:
+            shares = self._shares_by_id[entry_id] = not self._uses_local_entries(entry_id)
+            return shares
+
+    def _uses_local_entries(self, entry_id):
+        # Whether the entry is, or refers to directly or indirectly, an entry
+        # added to this overlay. Only the entries it refers to are parsed.
+        seen = set()
+        todo = [entry_id]
+        while todo:
+            ref_id = todo.pop()
+            if ref_id in seen:
+                continue
+            seen.add(ref_id)
+            if ref_id in self._messages_and_terms:
+                return True
+            try:
+                entry = self._base._get_entry(ref_id)
+            except KeyError:
+                continue
+            todo.extend(entry_references(entry))
+        return False
 
     def has_message(self, message_id):
         if message_id.startswith(TERM_SIGIL) or ATTRIBUTE_SEPARATOR in message_id:
             return False
-        return message_id in self._messages_and_terms
+        entry = self._messages_and_terms.get(message_id)
+        if entry is not None:
+            if not isinstance(entry, UnparsedEntry):
+                return True
+            # Only this entry is parsed, to find out if any of its
+            # definitions are free of syntax errors.
+            try:
+                self._get_entry(message_id)
+                return True
+            except KeyError:
+                pass
+        return self._base is not None and self._base.has_message(message_id)
 
     def lookup(self, full_id):
-        if full_id not in self._compiled:
+        try:
+            return self._compiled[full_id]
+        except KeyError:
+            pass
+        with self._compile_lock:
+            # Another thread may have compiled it while we waited
+            compiled = self._compiled.get(full_id)
+            if compiled is not None:
+                return compiled
+            node = self._snapshot_trees.get(full_id)
+            if node is not None:
+                compiled = self._compiler.from_resolver_tree(node)
+                self._add_compiled(full_id, compiled)
+                self._snapshot_trees.pop(full_id, None)
+                return compiled
             entry_id = full_id.split(ATTRIBUTE_SEPARATOR, 1)[0]
-            entry = self._messages_and_terms[entry_id]
+            if entry_id not in self._compiled_entries:
+                if self._shares_entry(entry_id):
+                    compiled = self._base.lookup(full_id)
+                    self._add_compiled(full_id, compiled)
+                    return compiled
+                self._compile_entry(entry_id)
+            return self._compiled[full_id]
+
+    def compile_all(self):
+        """
+        Compiles all messages and terms that haven't been compiled yet, so
+        that formatting them doesn't have to. Returns `compile_stats()`.
+
+        For an overlay, this also compiles all the messages of its base.
+        """
+        if self._share_compiled:
+            self._base.compile_all()
+        self._compile_entries([entry_id for entry_id in self._entry_ids()
+                               if not self._shares_entry(entry_id)])
+        for full_id in list(self._snapshot_trees):
+            self.lookup(full_id)
+        return self.compile_stats()
+
+    def freeze(self):
+        """
+        Compiles all messages, and makes the compiled messages immutable, so
+        that formatting them never writes to them. After this, no more
+        messages can be added.
+
+        This is intended for servers that load messages and then fork worker
+        processes, which can then share the memory used by the bundle (see
+        `gc.freeze`).
+
+        Freezing an overlay also freezes its base.
+        """
+        if self._share_compiled and not self._base._frozen:
+            self._base.freeze()
+        self.compile_all()
+        for compiled in self._compiled.values():
+            freeze_tree(self._compiler.resolver_tree(compiled), self)
+        intern = sys.intern if six.PY3 else (lambda s: s)
+        self._compiled = {intern(full_id): compiled
+                          for full_id, compiled in self._compiled.items()}
+        self._static_messages = {intern(full_id): intern(value)
+                                 for full_id, value in self._static_messages.items()}
+        # References can't be unlinked any more
+        self._fallback_links = []
+        self._frozen = True
+
+    def compile_stats(self):
+        """
+        Returns a `CompileStats` tuple with the number of entries compiled so
+        far, and the total time taken in seconds.
+        """
+        return CompileStats(self._compile_count, self._compile_time)
+
+    def _compile_entries(self, entry_ids):
+        for entry_id in entry_ids:
+            with self._compile_lock:
+                if entry_id in self._compiled_entries:
+                    continue
+                try:
+                    self._get_entry(entry_id)
+                except KeyError:
+                    # Syntax error found by lazy parsing
+                    continue
+                self._compile_entry(entry_id)
+
+    def _precompile_worker(self):
+        while True:
+            with self._precompile_lock:
+                try:
+                    entry_ids = self._precompile_queue.get_nowait()
+                except queue.Empty:
+                    self._precompile_thread = None
+                    return
+            try:
+                self._compile_entries(entry_ids)
+            except Exception:
+                # The entries are compiled again when they are used
+                logger.exception("Error precompiling FTL messages")
+            finally:
+                self._precompile_queue.task_done()
+
+    def _compile_entry(self, entry_id):
+        entry = self._get_entry(entry_id)
+        depth = getattr(self._compiling, 'depth', 0)
+        self._compiling.depth = depth + 1
+        start = default_timer()
+        try:
             compiled = self._compiler(entry)
-            if compiled.value is not None:
-                self._compiled[entry_id] = compiled.value
-            for attr in compiled.attributes:
-                self._compiled[ATTRIBUTE_SEPARATOR.join([entry_id, attr.id.name])] = attr.value
-        return self._compiled[full_id]
+        finally:
+            self._compiling.depth = depth
+        if depth == 0:
+            self._compile_time += default_timer() - start
+        self._compile_count += 1
+        if compiled.value is not None:
+            self._add_compiled(entry_id, compiled.value)
+        for attr in compiled.attributes:
+            self._add_compiled(ATTRIBUTE_SEPARATOR.join([entry_id, attr.id.name]), attr.value)
+        self._compiled_entries.add(entry_id)
+        if not self._keep_ast:
+            # The compiled entry has everything has_message and get_message
+            # need, and shares its values with _compiled.
+            self._messages_and_terms[entry_id] = compiled
+
+    def _add_compiled(self, full_id, compiled):
+        self._compiled[full_id] = compiled
+        if isinstance(compiled, Literal) and not full_id.startswith(TERM_SIGIL):
+            self._static_messages[full_id] = compiled.value
 
     def format(self, message_id, args=None):
+        try:
+            # Fast path for messages that don't depend on args and can't
+            # produce errors.
+            return [self._static_messages[message_id], []]
+        except KeyError:
+            pass
         if message_id.startswith(TERM_SIGIL):
             raise LookupError(message_id)
-        if args is not None:
-            fluent_args = {
-                argname: native_to_fluent(argvalue)
-                for argname, argvalue in args.items()
-            }
-        else:
-            fluent_args = {}
+        return self._format(self.lookup(message_id), args)
 
+    def _format(self, resolve, args):
         errors = []
+        env = self._environments.acquire(self._convert_args(args), errors)
+        try:
+            return [resolve(env), errors]
+        finally:
+            self._environments.release(env)
+
+    def _convert_args(self, args):
+        if args is None:
+            return NO_ARGS
+        return FluentArgs(args)
+
+    def format_many(self, messages, args=None):
+        """
+        Formats a list of messages, returning a list of `[value, errors]`
+        results in the same order, as per `format`.
+
+        Each item in `messages` can be either a message id, which is formatted
+        with `args`, or a `(message_id, args)` tuple. The work of converting
+        args and setting up for formatting is shared between messages, so this
+        is faster than calling `format` for each one.
+
+        Raises LookupError if any of the messages is not found.
+        """
+        results = []
+        # Converted args for each args object
+        converted_args = {}
+        env = self._environments.acquire(None, None)
+        try:
+            for item in messages:
+                if isinstance(item, six.string_types):
+                    message_id, message_args = item, args
+                else:
+                    message_id, message_args = item
+                try:
+                    results.append([self._static_messages[message_id], []])
+                    continue
+                except KeyError:
+                    pass
+                if message_id.startswith(TERM_SIGIL):
+                    raise LookupError(message_id)
+                resolve = self.lookup(message_id)
+                try:
+                    fluent_args = converted_args[id(message_args)]
+                except KeyError:
+                    fluent_args = converted_args[id(message_args)] = self._convert_args(message_args)
+                errors = []
+                env.reset(fluent_args, errors)
+                results.append([resolve(env), errors])
+        finally:
+            self._environments.release(env)
+        return results
+
+    def format_batch(self, message_id, columns, args=None):
+        """
+        Formats one message for many rows of arguments, given as columns.
+
+        `columns` is a dictionary mapping argument names to sequences of
+        values, all of the same length, such as lists or NumPy arrays. `args`
+        can contain arguments that are the same for every row.
+
+        Returns `[values, errors]`, where `values` is a list with the formatted
+        message for each row, and `errors` a list of the errors for each row.
+        """
+        columns = {name: _column_to_list(values) for name, values in columns.items()}
+        row_counts = set(len(values) for values in columns.values())
+        if len(row_counts) != 1:
+            raise ValueError("columns must be non-empty and all the same length")
+        row_count = row_counts.pop()
+
+        if message_id in self._static_messages:
+            return [[self._static_messages[message_id]] * row_count,
+                    [[] for i in range(row_count)]]
+        if message_id.startswith(TERM_SIGIL):
+            raise LookupError(message_id)
         resolve = self.lookup(message_id)
-        env = ResolverEnvironment(context=self,
-                                  current=CurrentEnvironment(args=fluent_args),
-                                  errors=errors)
-        return [resolve(env), errors]
+
+        # The message is looked up and the environment set up once. Number
+        # and date patterns and plural categories are cached and shared
+        # between rows.
+        shared_args = dict(args) if args is not None else {}
+        columns = list(columns.items())
+        values = []
+        errors = []
+        env = self._environments.acquire(None, None)
+        try:
+            for i in range(row_count):
+                row_args = shared_args.copy()
+                for name, column in columns:
+                    row_args[name] = column[i]
+                row_errors = []
+                env.reset(FluentArgs(row_args), row_errors)
+                values.append(resolve(env))
+                errors.append(row_errors)
+        finally:
+            self._environments.release(env)
+        return [values, errors]
+
+    def get_message(self, message_id):
+        """
+        Returns a `FluentMessage` for the message, which can be stored and used
+        to format the message many times, without looking it up again.
+
+        Raises LookupError if the message is not found.
+        """
+        if message_id.startswith(TERM_SIGIL):
+            raise LookupError(message_id)
+        entry_id, _, attr_name = message_id.partition(ATTRIBUTE_SEPARATOR)
+        entry = self._get_entry(entry_id)
+        if attr_name:
+            if not any(attr.id.name == attr_name for attr in entry.attributes):
+                raise LookupError(message_id)
+            return FluentMessage(self, message_id)
+        return FluentMessage(self, message_id,
+                             has_value=entry.value is not None,
+                             attribute_names=[attr.id.name for attr in entry.attributes])
+
+    def save_snapshot(self, fileobj):
+        """
+        Compiles all messages, and writes the compiled bundle to the binary
+        file object `fileobj`, to be loaded using `FluentBundle.load_snapshot`.
+        """
+        self.compile_all()
+        write_snapshot(fileobj, {
+            'locales': self.locales,
+            'use_isolating': self._use_isolating,
+            'compiler': self._compiler_name,
+            'messages_and_terms': {entry_id: self._snapshot_entry(self._get_entry(entry_id))
+                                   for entry_id in self._entry_ids()},
+            'compiled': {full_id: self._compiler.resolver_tree(compiled)
+                         for full_id, compiled in self._all_compiled().items()},
+            'compiled_entries': set(self._entry_ids()),
+        })
+
+    def _all_compiled(self):
+        # Compiled values by id, including those of an overlay's base
+        compiled = {}
+        if self._share_compiled:
+            for full_id, value in self._base._all_compiled().items():
+                if self._shares_entry(full_id.split(ATTRIBUTE_SEPARATOR, 1)[0]):
+                    compiled[full_id] = value
+        compiled.update(self._compiled)
+        return compiled
+
+    def _snapshot_entry(self, entry):
+        if not isinstance(entry, BaseResolver):
+            return entry
+        # A compiled entry kept instead of the AST, which can contain
+        # generated functions that can't be pickled.
+        tree = self._compiler.resolver_tree
+        return type(entry)(entry.id,
+                           value=None if entry.value is None else tree(entry.value),
+                           attributes=[Attribute(attr.id, tree(attr.value))
+                                       for attr in entry.attributes])
+
+    @classmethod
+    def load_snapshot(cls, fileobj, functions=None):
+        """
+        Returns a `FluentBundle` loaded from a snapshot written by
+        `save_snapshot`, without parsing or compiling messages again. Custom
+        functions are not saved in snapshots, and must be passed again.
+
+        Raises `fluent.runtime.snapshot.SnapshotError` if `fileobj` doesn't
+        contain a valid snapshot for this version of fluent.runtime.
+        Snapshots are pickles, so only load them from trusted sources.
+        """
+        state = read_snapshot(fileobj)
+        bundle = cls(state['locales'], functions=functions,
+                     use_isolating=state['use_isolating'],
+                     compiler=state['compiler'])
+        bundle._messages_and_terms = state['messages_and_terms']
+        bundle._keep_ast = not any(isinstance(entry, BaseResolver)
+                                   for entry in bundle._messages_and_terms.values())
+        for full_id, node in state['compiled'].items():
+            if isinstance(node, Literal):
+                bundle._add_compiled(full_id, node)
+            else:
+                # Generating code is relatively slow, so this is done on first
+                # use, like compiling.
+                bundle._snapshot_trees[full_id] = node
+        bundle._compiled_entries = state['compiled_entries']
+        return bundle
 
     def _get_babel_locale(self):
         for l in self.locales:
-            try:
-                return babel.Locale.parse(l.replace('-', '_'))
-            except babel.UnknownLocaleError:
-                continue
+            babel_locale = get_babel_locale(l)
+            if babel_locale is not None:
+                return babel_locale
         # TODO - log error
         return babel.Locale.default()
+
+
+def _resource_entries(resource):
+    return [(ast_to_id(item), item) for item in resource.body
+            if isinstance(item, (Message, Term))]
+
+
+class UnparsedEntry(object):
+    """
+    The location of a message or term in FTL source, which hasn't been
+    parsed yet. `next` is the next definition with the same id in the
+    source, if any.
+    """
+    __slots__ = ['source', 'start', 'end', 'next']
+
+    def __init__(self, source, start, end):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.next = None
+
+    def text(self):
+        return self.source[self.start:self.end]
+
+
+def _column_to_list(values):
+    # NumPy arrays (and similar) convert their items to native Python types
+    # with tolist().
+    if hasattr(values, 'tolist'):
+        return values.tolist()
+    return list(values)
+
+
+class FluentMessage(object):
+    """
+    A message (or message attribute) from a `FluentBundle`, looked up in
+    advance. Use `FluentBundle.get_message` to create these.
+
+    `FluentMessage.format` is equivalent to `FluentBundle.format` for the
+    same id, but avoids parsing the id and looking up the message on every
+    call. Attributes of the message are available as `FluentMessage` objects
+    in the `attributes` dictionary.
+    """
+    def __init__(self, bundle, message_id, has_value=True, attribute_names=()):
+        self.bundle = bundle
+        self.id = message_id
+        self.attributes = {
+            name: FluentMessage(bundle, ATTRIBUTE_SEPARATOR.join([message_id, name]))
+            for name in attribute_names
+        }
+        self._resolve = bundle.lookup(message_id) if has_value else None
+        self._static = bundle._static_messages.get(message_id)
+
+    def format(self, args=None):
+        if self._static is not None:
+            return [self._static, []]
+        if self._resolve is None:
+            # Message with only attributes
+            raise LookupError(self.id)
+        return self.bundle._format(self._resolve, args)
+
+    def __repr__(self):
+        return '<FluentMessage {0}>'.format(self.id)
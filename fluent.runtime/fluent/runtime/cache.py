@@ -0,0 +1,53 @@
+from __future__ import absolute_import, unicode_literals
+
+import threading
+from collections import OrderedDict, namedtuple
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class BoundedCache(object):
+    """
+    A process-wide cache of values that are expensive to create, holding at
+    most `maxsize` items. When full, the oldest item is evicted.
+
+    Lookups don't take a lock, so this is cheap to use on hot paths, and safe
+    to use from many threads. In the worst case two threads both create a
+    missing value, and one of them wins. Hit and miss counts are approximate
+    when used from many threads.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, create):
+        """
+        Returns the value for `key`, calling `create(key)` to make it if it
+        is not already cached.
+        """
+        try:
+            value = self._data[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = create(key)
+        with self._lock:
+            while self._data and len(self._data) >= self.maxsize:
+                self._data.popitem(last=False)
+            self._data[key] = value
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
@@ -0,0 +1,280 @@
+from __future__ import absolute_import, unicode_literals
+
+import six
+
+from . import resolver
+from .errors import FluentCyclicReferenceError, FluentFormatError, FluentReferenceError
+from .prepare import Compiler
+from .resolver import FluentNoneResolver, resolve
+from .types import FluentNone, FluentType
+
+
+"""
+An alternative compiler backend that turns the value of each Message, Term
+and Attribute into a generated Python function, rather than a tree of
+resolver nodes that is walked on every call.
+
+The generated code is a straight translation of the `__call__` methods in
+`resolver`, with the tree walk unrolled: string constants are inlined,
+intermediate values live in local variables, and patterns are built with a
+single `''.join`. Anything that doesn't have a specialized translation is
+called as the resolver node it was compiled to, so the two backends always
+produce the same output and errors.
+"""
+
+
+FSI = "\u2068"
+PDI = "\u2069"
+
+# Names available to all generated functions.
+GENERATED_GLOBALS = {
+    'FSI': FSI,
+    'PDI': PDI,
+    'MAX_PARTS': resolver.Pattern.MAX_PARTS,
+    'NO_ARGS': resolver.NO_ARGS,
+    'FluentCyclicReferenceError': FluentCyclicReferenceError,
+    'FluentFormatError': FluentFormatError,
+    'FluentNone': FluentNone,
+    'FluentNoneResolver': FluentNoneResolver,
+    'FluentReferenceError': FluentReferenceError,
+    'FluentType': FluentType,
+    'resolve': resolve,
+    'text_type': six.text_type,
+}
+
+
+class CodegenCompiler(Compiler):
+    """
+    Compiler that produces the same resolver tree as `Compiler`, but replaces
+    the values of entries and their attributes with generated functions.
+    """
+    def compile_Message(self, nodename, **kwargs):
+        entry = self.compile_generic(nodename, **kwargs)
+        if entry.value is not None:
+            entry.value = generate_function(entry.value)
+        for attr in entry.attributes:
+            attr.value = generate_function(attr.value)
+        return entry
+
+    compile_Term = compile_Message
+
+    def resolver_tree(self, compiled):
+        return getattr(compiled, 'node', compiled)
+
+    def from_resolver_tree(self, node):
+        return generate_function(node)
+
+
+def generate_function(node):
+    """
+    Returns a function that takes a `ResolverEnvironment` and is equivalent
+    to calling the resolver `node`.
+    """
+    if isinstance(node, (resolver.Literal, resolver.VariantList)):
+        # Literals are already as cheap as it gets. VariantLists need to stay
+        # nodes for VariantExpression to select from them.
+        return node
+    return FunctionGenerator().generate(node)
+
+
+class FunctionGenerator(object):
+    """
+    Generates the source of a single function. The `compile_*` methods emit
+    statements for a node, and return a Python expression for its value. The
+    expression is always either a literal or a name, so it can be used any
+    number of times without re-evaluating anything.
+    """
+    def __init__(self):
+        self.lines = []
+        self.indent = 1
+        self.names = {}
+        self.string_constants = {}
+        self.counter = 0
+
+    def generate(self, node):
+        result = self.compile_node(node)
+        self.emit('return {0}'.format(result))
+        source = '\n'.join(['def resolve_generated(env):'] + self.lines) + '\n'
+        namespace = dict(GENERATED_GLOBALS)
+        namespace.update(self.names)
+        six.exec_(compile(source, '<fluent generated code>', 'exec'), namespace)
+        function = namespace['resolve_generated']
+        function.source = source
+        function.node = node
+        return function
+
+    def emit(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def new_name(self):
+        self.counter += 1
+        return '_{0}'.format(self.counter)
+
+    def assign(self, expression):
+        name = self.new_name()
+        self.emit('{0} = {1}'.format(name, expression))
+        return name
+
+    def constant(self, value):
+        """
+        Makes an arbitrary object available to the generated code
+        """
+        name = '_c{0}'.format(len(self.names))
+        self.names[name] = value
+        return name
+
+    def string(self, value):
+        """
+        Returns a literal for a string constant
+        """
+        literal = repr(six.text_type(value))
+        self.string_constants[literal] = value
+        return literal
+
+    def compile_node(self, node):
+        handler = getattr(self, 'compile_' + type(node).__name__, self.compile_generic)
+        return handler(node)
+
+    def compile_generic(self, node):
+        return self.assign('{0}(env)'.format(self.constant(node)))
+
+    def compile_TextElement(self, node):
+        return self.string(node.value)
+
+    compile_StringLiteral = compile_InlinedText = compile_TextElement
+
+    def compile_NumberLiteral(self, node):
+        return self.constant(node.value)
+
+    def compile_Placeable(self, node):
+        return self.compile_node(node.expression)
+
+    def compile_IsolatingPlaceable(self, node):
+        inner = self.compile_node(node.expression)
+        if inner in self.string_constants:
+            return self.string(FSI + resolve(self.string_constants[inner], None) + PDI)
+        return self.assign('FSI + resolve({0}, env) + PDI'.format(inner))
+
+    def compile_Pattern(self, node):
+        # Cycle and size protection are checked up front. Where they would
+        # change anything, we defer to the resolver node to do the work.
+        pattern = self.constant(node)
+        result = self.new_name()
+        part_count = len(node.elements)
+        self.emit('if {0} not in env.active_patterns and env.part_count + {1} <= MAX_PARTS:'
+                  .format(pattern, part_count))
+        self.indent += 1
+        self.emit('env.active_patterns.add({0})'.format(pattern))
+        parts = []
+        for element in node.elements:
+            value = self.compile_node(element)
+            if value in self.string_constants:
+                parts.append(self.string(resolve(self.string_constants[value], None)))
+            else:
+                parts.append(self.assign('resolve({0}, env)'.format(value)))
+        self.emit('env.part_count += {0}'.format(part_count))
+        self.emit('env.active_patterns.discard({0})'.format(pattern))
+        self.emit("{0} = ''.join([{1}])".format(result, ', '.join(self.merge_strings(parts))))
+        self.indent -= 1
+        self.emit('else:')
+        self.emit('    {0} = {1}(env)'.format(result, pattern))
+        return result
+
+    def merge_strings(self, parts):
+        merged = []
+        for part in parts:
+            if merged and part in self.string_constants and merged[-1] in self.string_constants:
+                part = self.string(self.string_constants[merged.pop()] + self.string_constants[part])
+            merged.append(part)
+        return merged
+
+    def compile_MessageReference(self, node):
+        return self.assign('{0}.resolve_reference(env)(env)'.format(self.constant(node)))
+
+    compile_AttributeExpression = compile_MessageReference
+
+    def compile_TermReference(self, node):
+        result = self.new_name()
+        self.emit('env.push_args(NO_ARGS)')
+        self.emit('try:')
+        self.emit('    {0} = {1}.resolve_reference(env)(env)'.format(result, self.constant(node)))
+        self.emit('finally:')
+        self.emit('    env.pop_args()')
+        return result
+
+    def compile_VariableReference(self, node):
+        name = node.id.name
+        result = self.new_name()
+        self.emit('try:')
+        self.emit('    {0} = env.args[{1}]'.format(result, self.string(name)))
+        self.emit('except LookupError:')
+        self.emit('    if env.error_for_missing_arg:')
+        self.emit('        env.errors.append(FluentReferenceError({0}))'
+                  .format(self.string("Unknown external: {0}".format(name))))
+        self.emit('    {0} = FluentNoneResolver({1})'.format(result, self.string(name)))
+        self.emit('else:')
+        self.emit('    if not isinstance({0}, (FluentType, text_type)):'.format(result))
+        self.emit('        env.errors.append(TypeError({0}.format(type({1}))))'
+                  .format(self.string("Unsupported external type: " + name + ", {0}"), result))
+        self.emit('        {0} = FluentNone({1})'.format(result, self.string(name)))
+        return result
+
+    def compile_SelectExpression(self, node):
+        key = self.compile_node(node.selector)
+        index = self.assign('{0}.select_index(env, {1})'.format(self.constant(node), key))
+        result = self.new_name()
+        self.compile_variants(result, index, node.variants, 0, len(node.variants))
+        return result
+
+    def compile_variants(self, result, index, variants, start, end):
+        # A binary search on the index of the selected variant
+        if end - start == 1:
+            self.emit('{0} = {1}'.format(result, self.compile_node(variants[start].value)))
+            return
+        middle = (start + end) // 2
+        self.emit('if {0} < {1}:'.format(index, middle))
+        self.indent += 1
+        self.compile_variants(result, index, variants, start, middle)
+        self.indent -= 1
+        self.emit('else:')
+        self.indent += 1
+        self.compile_variants(result, index, variants, middle, end)
+        self.indent -= 1
+
+    def compile_CallExpression(self, node):
+        args = [self.compile_node(arg) for arg in node.positional]
+        kwargs = '{{{0}}}'.format(', '.join(
+            '{0}: {1}'.format(self.string(kwarg.name.name), self.compile_node(kwarg.value))
+            for kwarg in node.named
+        ))
+        result = self.new_name()
+
+        if isinstance(node.callee, (resolver.TermReference, resolver.AttributeExpression)):
+            term = self.assign('{0}.resolve_reference(env)'.format(self.constant(node.callee)))
+            if args:
+                self.emit('env.errors.append(FluentFormatError({0}))'.format(self.string(
+                    "Ignored positional arguments passed to term '{0}'"
+                    .format(node.callee.ref_id))))
+            self.emit('env.push_args({0})'.format(kwargs))
+            self.emit('try:')
+            self.emit('    {0} = {1}(env)'.format(result, term))
+            self.emit('finally:')
+            self.emit('    env.pop_args()')
+            return result
+
+        # builtin or custom function call
+        function_name = node.callee.id.name
+        function = self.new_name()
+        self.emit('try:')
+        self.emit('    {0} = env.context._functions[{1}]'.format(function, self.string(function_name)))
+        self.emit('except LookupError:')
+        self.emit('    env.errors.append(FluentReferenceError({0}))'
+                  .format(self.string("Unknown function: {0}".format(function_name))))
+        self.emit('    {0} = FluentNone({1})'.format(result, self.string(function_name + "()")))
+        self.emit('else:')
+        self.emit('    try:')
+        self.emit('        {0} = {1}({2})'.format(result, function, ', '.join(args + ['**' + kwargs])))
+        self.emit('    except Exception as e:')
+        self.emit('        env.errors.append(e)')
+        self.emit('        {0} = FluentNoneResolver({1})'.format(result, self.string(function_name + "()")))
+        return result
@@ -0,0 +1,109 @@
+from __future__ import absolute_import, unicode_literals
+
+from . import FluentBundle
+from .utils import ATTRIBUTE_SEPARATOR, TERM_SIGIL
+
+"""
+Formatting messages from a list of bundles for different locales, falling
+back to the next locale for messages that aren't translated.
+"""
+
+
+class FluentLocalization(object):
+    """
+    Formats messages using the first of `bundles` that has them, for example
+    bundles for `['fr-CA', 'fr', 'en-US']`.
+
+    Which bundle to use for each message is worked out in advance, and
+    updated when messages are added to or removed from the bundles, so
+    formatting a message costs a single dictionary lookup more than calling
+    `FluentBundle.format` on the right bundle.
+    """
+    def __init__(self, bundles):
+        self.bundles = list(bundles)
+        # Message id -> bundle to use for it
+        self._bundle_for_id = {}
+        for bundle in reversed(self.bundles):
+            self._bundle_for_id.update(
+                (entry_id, bundle) for entry_id in bundle._entry_ids()
+                if not entry_id.startswith(TERM_SIGIL))
+        for bundle in self.bundles:
+            bundle._add_listener(self)
+
+    @classmethod
+    def from_loader(cls, loader, locales, resource_ids=None, **kwargs):
+        """
+        Returns a `FluentLocalization` for `locales`, in order of preference,
+        using bundles created by a `fluent.runtime.loader.FluentResourceLoader`.
+        Other keyword arguments are passed to `FluentBundle`.
+        """
+        bundles = []
+        for i, locale in enumerate(locales):
+            # The following locales are used for number and date formatting
+            # if there is no locale data for this one.
+            bundle = FluentBundle(locales[i:], **kwargs)
+            for resource in loader.resources(locale, resource_ids):
+                bundle.add_resource(resource)
+            bundles.append(bundle)
+        return cls(bundles)
+
+    @property
+    def locales(self):
+        return [bundle.locales[0] for bundle in self.bundles]
+
+    def bundle_for(self, message_id):
+        """
+        Returns the bundle that is used to format `message_id`, or raises
+        LookupError if none of the bundles have it.
+        """
+        try:
+            return self._bundle_for_id[message_id]
+        except KeyError:
+            pass
+        # An attribute, a term, or a missing message
+        entry_id, _, attr_name = message_id.partition(ATTRIBUTE_SEPARATOR)
+        if attr_name and entry_id in self._bundle_for_id:
+            return self._bundle_for_id[entry_id]
+        raise LookupError(message_id)
+
+    def has_message(self, message_id):
+        bundle = self._bundle_for_id.get(message_id)
+        if bundle is not None and not bundle.has_message(message_id):
+            # With lazy_parse, the bundle has just found syntax errors in the
+            # message and removed it, so the next bundle with it is used.
+            return message_id in self._bundle_for_id
+        return bundle is not None
+
+    def format(self, message_id, args=None):
+        """
+        Formats the message from the first bundle that has it, returning
+        `[value, errors]`, as per `FluentBundle.format`.
+        """
+        bundle = self.bundle_for(message_id)
+        try:
+            return bundle.format(message_id, args)
+        except LookupError:
+            # With lazy_parse, a bundle finds syntax errors in a message when
+            # it is first used, and removes it, so another bundle may now be
+            # used for it.
+            if self.bundle_for(message_id) is bundle:
+                raise
+            return self.format(message_id, args)
+
+    def _bundle_changed(self, bundle, added, removed):
+        index = self.bundles.index(bundle)
+        for entry_id in added:
+            if entry_id.startswith(TERM_SIGIL):
+                continue
+            current = self._bundle_for_id.get(entry_id)
+            if current is None or self.bundles.index(current) > index:
+                self._bundle_for_id[entry_id] = bundle
+        for entry_id in removed:
+            if self._bundle_for_id.get(entry_id) is not bundle:
+                continue
+            for other in self.bundles[index + 1:]:
+                if other.has_message(entry_id):
+                    self._bundle_for_id[entry_id] = other
+                    break
+            else:
+                self._bundle_for_id.pop(entry_id, None)
@@ -0,0 +1,317 @@
+from __future__ import absolute_import, unicode_literals
+
+import codecs
+import contextlib
+import hashlib
+import io
+import logging
+import mmap
+import os
+import threading
+
+import six
+import fluent.syntax.parser
+from fluent.syntax import FluentParser
+from fluent.syntax import ast as FTL
+
+from . import FluentBundle
+from .cache import BoundedCache
+from .snapshot import SnapshotError, read_snapshot, write_snapshot
+
+"""
+Loading FTL files into bundles, and reloading them when they change.
+"""
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_EXTENSION = '.ftl'
+
+
+class FluentResourceLoader(object):
+    """
+    Loads FTL files from directories laid out as `{locale}/{file}.ftl`, and
+    creates bundles from them.
+
+    `roots` is a directory, or a list of directories, that contain a
+    directory for each locale. Files are read using `mmap`, and parsed
+    resources are cached by content in a `ResourceCache`, so that unchanged
+    files, and files with the same contents in different places, are only
+    parsed once. Pass `cache_dir` to also cache parsed resources on disk,
+    for use by later processes.
+    """
+    def __init__(self, roots, cache_dir=None, cache=None):
+        if isinstance(roots, six.string_types):
+            roots = [roots]
+        self.roots = list(roots)
+        self.cache = cache if cache is not None else ResourceCache(cache_dir=cache_dir)
+
+    def locales(self):
+        """
+        Returns a sorted list of the locales found in the root directories
+        """
+        locales = set()
+        for root in self.roots:
+            if os.path.isdir(root):
+                locales.update(name for name in os.listdir(root)
+                               if os.path.isdir(os.path.join(root, name)))
+        return sorted(locales)
+
+    def resource_ids(self, locale):
+        """
+        Returns a sorted list of the ids of the FTL files for `locale`, which
+        are their paths relative to the locale directory, using `/` as the
+        separator, e.g. `main.ftl` or `app/menus.ftl`.
+        """
+        resource_ids = set()
+        for root in self.roots:
+            locale_dir = os.path.join(root, locale)
+            for dirpath, dirnames, filenames in os.walk(locale_dir):
+                relative_dir = os.path.relpath(dirpath, locale_dir)
+                for filename in filenames:
+                    if filename.endswith(RESOURCE_EXTENSION):
+                        path = os.path.normpath(os.path.join(relative_dir, filename))
+                        resource_ids.add(path.replace(os.sep, '/'))
+        return sorted(resource_ids)
+
+    def paths(self, locale, resource_ids=None):
+        """
+        Returns the paths of the existing files for `locale` and the given
+        resource ids (by default, all of them), in the order of the roots and
+        then of `resource_ids`.
+        """
+        if resource_ids is None:
+            resource_ids = self.resource_ids(locale)
+        paths = []
+        for root in self.roots:
+            for resource_id in resource_ids:
+                path = os.path.join(root, locale, *resource_id.split('/'))
+                if os.path.isfile(path):
+                    paths.append(path)
+        return paths
+
+    def resources(self, locale, resource_ids=None):
+        """
+        Returns a list of the parsed `fluent.syntax.ast.Resource` objects for
+        `locale`, for the files returned by `paths`.
+        """
+        return [self.cache.get(path) for path in self.paths(locale, resource_ids)]
+
+    def bundle(self, locale, resource_ids=None, **kwargs):
+        """
+        Returns a `FluentBundle` for `locale`, with the messages in the given
+        resources (by default, all of them). Other keyword arguments are
+        passed to `FluentBundle`.
+        """
+        bundle = FluentBundle([locale], **kwargs)
+        for resource in self.resources(locale, resource_ids):
+            bundle.add_resource(resource)
+        return bundle
+
+
+class ResourceCache(object):
+    """
+    A cache of parsed FTL files. Parsed resources are kept in memory, keyed
+    by the hash of their contents, and optionally in `cache_dir` on disk.
+    Files are only read again if their modification time or size changed.
+
+    Cached resources are shared, and must not be modified.
+    """
+    def __init__(self, cache_dir=None, maxsize=1000):
+        self.cache_dir = cache_dir
+        # Path -> ((mtime, size), content hash)
+        self._stats = {}
+        self._resources = BoundedCache(maxsize)
+
+    def get(self, path):
+        """
+        Returns the parsed `fluent.syntax.ast.Resource` for the FTL file at
+        `path`.
+        """
+        stat = os.stat(path)
+        key = (getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size)
+        cached = self._stats.get(path)
+        if cached is not None and cached[0] == key:
+            return self._resources.get(cached[1], lambda digest: self._load(path, digest))
+        with _map_file(path) as data:
+            digest = hashlib.sha256(data).hexdigest()
+            self._stats[path] = (key, digest)
+            return self._resources.get(digest, lambda digest: self._load(path, digest, data))
+
+    def _load(self, path, digest, data=None):
+        cache_path = None
+        if self.cache_dir is not None:
+            # Resources parsed by other versions of fluent.syntax may differ
+            cache_path = os.path.join(self.cache_dir, '{0}-{1}.pickle'.format(
+                digest, parser_version()))
+            try:
+                with open(cache_path, 'rb') as f:
+                    resource = read_snapshot(f)
+                if isinstance(resource, FTL.Resource):
+                    return resource
+            except (IOError, OSError, SnapshotError):
+                pass
+        if data is None:
+            # Evicted from memory since we read the file
+            with _map_file(path) as data:
+                resource = _parse(data)
+        else:
+            resource = _parse(data)
+        if cache_path is not None:
+            _write_cache_file(cache_path, resource)
+        return resource
+
+    def clear(self):
+        self._stats.clear()
+        self._resources.clear()
+
+    def info(self):
+        """
+        Returns a `CacheInfo` for the resources cached in memory. Misses are
+        resources that were parsed, or loaded from `cache_dir`.
+        """
+        return self._resources.info()
+
+
+_parser_version = None
+
+
+def parser_version():
+    """
+    Returns a string that identifies the installed version of the
+    fluent.syntax parser, which is part of the name of disk cache files.
+    """
+    global _parser_version
+    if _parser_version is None:
+        # A hash of the code, which also changes for unreleased versions
+        digest = hashlib.sha256()
+        for module in (fluent.syntax.parser, FTL):
+            with open(module.__file__, 'rb') as f:
+                digest.update(f.read())
+        _parser_version = digest.hexdigest()[:16]
+    return _parser_version
+
+
+@contextlib.contextmanager
+def _map_file(path):
+    # The file is hashed and decoded directly from the map, without copying
+    # it to a bytes object first.
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files can't be mapped
+            yield b''
+            return
+        with contextlib.closing(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) as data:
+            yield data
+
+
+def _parse(data):
+    return FluentParser().parse(codecs.utf_8_decode(data, 'strict', True)[0])
+
+
+def _write_cache_file(cache_path, resource):
+    # Written to a temporary file first, so that other processes never read
+    # half written files
+    tmp_path = '{0}.{1}.tmp'.format(cache_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            write_snapshot(f, resource)
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError):
+        logger.warning("Could not write FTL cache file %s", cache_path, exc_info=True)
+
+
+class FluentFileLoader(object):
+    """
+    Loads FTL files into a `FluentBundle`, and reloads the files that have
+    changed since they were loaded. Only the messages in changed files, and
+    the messages that use them, are compiled again.
+
+    Each message and term should be defined in only one of the files. The
+    bundle must have been created with `keep_ast=True` (the default).
+    """
+    def __init__(self, bundle, paths):
+        if not bundle._keep_ast:
+            raise ValueError("Can't reload files into a FluentBundle with keep_ast=False")
+        self.bundle = bundle
+        self.paths = list(paths)
+        # Path -> (stat key, ids of the entries loaded from the file)
+        self._loaded = {}
+        self._lock = threading.Lock()
+        self._watch_thread = None
+        self._stop_watching = threading.Event()
+
+    def load(self):
+        """
+        Loads all the files that haven't been loaded yet, or have changed.
+        Returns the list of paths that were loaded.
+        """
+        return self.reload_changed()
+
+    def reload_changed(self):
+        """
+        Loads files that have changed since they were last loaded, replacing
+        their messages in the bundle, and removes the messages of files that
+        no longer exist. Returns the list of paths that changed.
+        """
+        changed = []
+        with self._lock:
+            for path in self.paths:
+                if self._reload_file(path):
+                    changed.append(path)
+        return changed
+
+    def _reload_file(self, path):
+        loaded = self._loaded.get(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            if loaded is None:
+                return False
+            del self._loaded[path]
+            self.bundle._remove_entries(loaded[1])
+            return True
+        key = (getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size)
+        if loaded is not None and loaded[0] == key:
+            return False
+        with io.open(path, encoding='utf-8') as f:
+            source = f.read()
+        entries = self.bundle._parse_entries(source)
+        entry_ids = [full_id for full_id, entry in entries]
+        if loaded is None:
+            self.bundle._add_entries(entries, replace=False)
+        else:
+            self.bundle._add_entries(entries, replace=True)
+            self.bundle._remove_entries(set(loaded[1]).difference(entry_ids))
+        self._loaded[path] = (key, entry_ids)
+        return True
+
+    def watch(self, interval=1.0):
+        """
+        Starts a background thread that checks the files for changes every
+        `interval` seconds, and reloads them, until `stop` is called.
+        """
+        if self._watch_thread is not None:
+            return
+        self._stop_watching.clear()
+        thread = threading.Thread(target=self._watch, args=(interval,),
+                                  name='fluent-file-watcher')
+        thread.daemon = True
+        self._watch_thread = thread
+        thread.start()
+
+    def stop(self):
+        """
+        Stops the thread started by `watch`
+        """
+        thread, self._watch_thread = self._watch_thread, None
+        if thread is not None:
+            self._stop_watching.set()
+            thread.join()
+
+    def _watch(self, interval):
+        while not self._stop_watching.wait(interval):
+            try:
+                self.reload_changed()
+            except Exception:
+                # Keep watching, the file may be fixed
+                logger.exception("Error reloading FTL files")
@@ -0,0 +1,90 @@
+from __future__ import absolute_import, unicode_literals
+
+import babel
+import babel.plural
+import six
+
+from .cache import BoundedCache
+
+"""
+Process-wide registry of locale data, shared by all `FluentBundle` instances.
+Each locale string is parsed with Babel once, and each plural rule is
+compiled once.
+"""
+
+LOCALE_CACHE_SIZE = 1000
+
+# Plural categories of integers 0 <= n < PLURAL_TABLE_SIZE are stored in a
+# table, other ints and floats in a bounded memo.
+PLURAL_TABLE_SIZE = 10000
+PLURAL_MEMO_SIZE = 10000
+
+_babel_locales = BoundedCache(LOCALE_CACHE_SIZE)
+_plural_forms = BoundedCache(LOCALE_CACHE_SIZE)
+
+
+def get_babel_locale(locale):
+    """
+    Returns the `babel.Locale` for a locale string like 'en-US', or None if
+    Babel doesn't know the locale.
+    """
+    return _babel_locales.get(locale, _parse_locale)
+
+
+def get_plural_form(babel_locale):
+    """
+    Returns a function that returns the plural category of a number, for the
+    given `babel.Locale`.
+    """
+    return _plural_forms.get(babel_locale, _compile_plural_form)
+
+
+def preload_locales(locales):
+    """
+    Loads the data for a list of locale strings, so that creating bundles for
+    them later doesn't need to.
+    """
+    for locale in locales:
+        babel_locale = get_babel_locale(locale)
+        if babel_locale is not None:
+            get_plural_form(babel_locale)
+
+
+def _parse_locale(locale):
+    try:
+        return babel.Locale.parse(locale.replace('-', '_'))
+    except babel.UnknownLocaleError:
+        return None
+
+
+def _compile_plural_form(babel_locale):
+    return PluralForm(babel.plural.to_python(babel_locale.plural_form))
+
+
+class PluralForm(object):
+    """
+    Returns the plural category of a number, memoizing the results of the
+    Babel generated plural rule function.
+    """
+    def __init__(self, rule):
+        self.rule = rule
+        # Filled in as numbers are seen
+        self.table = [None] * PLURAL_TABLE_SIZE
+        self.memo = BoundedCache(PLURAL_MEMO_SIZE)
+
+    def __call__(self, number):
+        if isinstance(number, six.integer_types) and 0 <= number < PLURAL_TABLE_SIZE:
+            category = self.table[number]
+            if category is None:
+                category = self.table[number] = self.rule(number)
+            return category
+        if isinstance(number, (six.integer_types, float)):
+            # Floats are keyed separately, because some rules treat 1 and 1.0
+            # differently, although they are equal.
+            return self.memo.get((isinstance(number, float), number), self._evaluate_memo_key)
+        # Decimals can't be memoized by value, because trailing zeros matter
+        # to some rules.
+        return self.rule(number)
+
+    def _evaluate_memo_key(self, key):
+        return self.rule(key[1])
@@ -1,11 +1,39 @@
 from __future__ import absolute_import, unicode_literals
+
+import threading
+
+import six
+
 from fluent.syntax import ast as FTL
 from . import resolver
 
+# Nodes that only depend on their args, so that a term made of these can be
+# evaluated at compile time.
+CONSTANT_TERM_NODES = (
+    resolver.Literal,
+    resolver.Pattern,
+    resolver.Placeable,
+    resolver.IsolatingPlaceable,
+    resolver.NumberLiteral,
+    resolver.VariableReference,
+    resolver.SelectExpression,
+    resolver.Variant,
+    resolver.Identifier,
+)
+
+# How many references deep lookup_constant_candidate compiles the entries it
+# looks at. Compiling each entry takes several stack frames, so long chains
+# of references are left to be compiled separately, when they are formatted.
+MAX_INLINING_DEPTH = 10
+
 
 class Compiler(object):
-    def __init__(self, use_isolating=False):
+    def __init__(self, use_isolating=False, context=None):
         self.use_isolating = use_isolating
+        # The FluentBundle we are compiling for, if any. This is needed to
+        # inline references and format numbers at compile time.
+        self.context = context
+        self._local = threading.local()
 
     def __call__(self, item):
         if isinstance(item, FTL.BaseNode):
@@ -28,6 +56,7 @@ class Compiler(object):
         return getattr(resolver, nodename)(**kwargs)
 
     def compile_Placeable(self, _, expression, **kwargs):
+        expression = self.fold_constant(expression)
         if self.use_isolating:
             return resolver.IsolatingPlaceable(expression=expression, **kwargs)
         if isinstance(expression, resolver.Literal):
@@ -41,6 +70,8 @@ class Compiler(object):
         ):
             # Don't isolate isolated placeables
             return elements[0].expression
+        elements = self.merge_literals(
+            [self.fold_isolating_placeable(element) for element in elements])
         if any(
             not isinstance(child, resolver.Literal)
             for child in elements
@@ -48,6 +79,142 @@ class Compiler(object):
             return resolver.Pattern(elements=elements, **kwargs)
         if len(elements) == 1:
             return elements[0]
-        return resolver.TextElement(
-            ''.join(child(None) for child in elements)
+        return text_element(
+            ''.join(child(None) for child in elements),
+            elements
         )
+
+    def merge_literals(self, elements):
+        # Each part of a pattern is truncated to MAX_PART_LENGTH separately,
+        # so we can only merge literals while they fit.
+        merged = []
+        for element in elements:
+            if (
+                merged and
+                isinstance(element, resolver.Literal) and
+                isinstance(merged[-1], resolver.Literal)
+            ):
+                text = merged[-1](None) + element(None)
+                if len(text) <= resolver.MAX_PART_LENGTH:
+                    merged[-1] = text_element(text, [merged[-1], element])
+                    continue
+            merged.append(element)
+        return merged
+
+    def fold_isolating_placeable(self, element):
+        if (
+            isinstance(element, resolver.IsolatingPlaceable) and
+            isinstance(element.expression, resolver.Literal)
+        ):
+            text = element(None)
+            if len(text) <= resolver.MAX_PART_LENGTH:
+                return text_element(text, [element.expression])
+        return element
+
+    def fold_constant(self, expression):
+        """
+        Replaces the expression of a placeable with the text it evaluates to,
+        if that is constant. This covers number literals, references to
+        messages and attributes with static text, references to terms, and
+        calls of terms with literal arguments. Otherwise returns `expression`
+        unchanged.
+        """
+        if isinstance(expression, resolver.NumberLiteral):
+            if self.context is None:
+                return expression
+            return resolver.TextElement(expression.value.format(self.context._babel_locale))
+
+        if isinstance(expression, (resolver.MessageReference, resolver.AttributeExpression)):
+            # These are evaluated with the current args, so only static text
+            # can be inlined.
+            reference, args = expression, None
+        elif isinstance(expression, resolver.TermReference):
+            reference, args = expression, {}
+        elif (
+            isinstance(expression, resolver.CallExpression) and
+            isinstance(expression.callee, resolver.TermReference) and
+            not expression.positional and
+            all(isinstance(kwarg.value, (resolver.Literal, resolver.NumberLiteral))
+                for kwarg in expression.named)
+        ):
+            reference = expression.callee
+            args = {kwarg.name.name: kwarg.value(None) for kwarg in expression.named}
+        else:
+            return expression
+
+        target = self.lookup_constant_candidate(reference)
+        if isinstance(target, resolver.InlinedText):
+            # Text from other messages is only inlined one level deep, so that
+            # the protection against expanding messages into huge numbers of
+            # parts still works for long chains of messages.
+            return expression
+        if isinstance(target, resolver.Literal):
+            text = target(None)
+        elif args is not None and target is not None and is_constant_term(target):
+            errors = []
+            env = resolver.ResolverEnvironment(self.context, errors, args=args,
+                                               error_for_missing_arg=False)
+            text = resolver.resolve(target(env), env)
+            if errors or not isinstance(text, six.text_type):
+                return expression
+        else:
+            return expression
+        if len(text) > resolver.MAX_PART_LENGTH:
+            return expression
+        if args is None:
+            return resolver.InlinedText(text)
+        return resolver.TextElement(text)
+
+    def lookup_constant_candidate(self, reference):
+        """
+        Returns the resolver tree of the target of `reference`, or None if it
+        can't be found.
+        """
+        if self.context is None:
+            return None
+        ref_id = reference.ref_id
+        # The entries we are currently looking up in this thread, which would
+        # be compiled again if they refer to each other.
+        inlining = self._local.__dict__.setdefault('inlining', set())
+        if ref_id in inlining or len(inlining) >= MAX_INLINING_DEPTH:
+            return None
+        inlining.add(ref_id)
+        try:
+            return self.resolver_tree(self.context.lookup(ref_id))
+        except LookupError:
+            return None
+        finally:
+            inlining.discard(ref_id)
+
+    def resolver_tree(self, compiled):
+        """
+        Returns the resolver tree for a compiled message or term value
+        """
+        return compiled
+
+    def from_resolver_tree(self, node):
+        """
+        Returns the compiled value for a resolver tree returned by
+        `resolver_tree`
+        """
+        return node
+
+
+def text_element(text, parts):
+    """
+    Returns a literal for `text`, made from the literals `parts`
+    """
+    if any(isinstance(part, resolver.InlinedText) for part in parts):
+        return resolver.InlinedText(text)
+    return resolver.TextElement(text)
+
+
+def is_constant_term(node):
+    if not isinstance(node, CONSTANT_TERM_NODES) or isinstance(node, resolver.InlinedText):
+        return False
+    for name, value in resolver.node_fields(node):
+        values = value if isinstance(value, list) else [value]
+        for value in values:
+            if isinstance(value, resolver.BaseResolver) and not is_constant_term(value):
+                return False
+    return True
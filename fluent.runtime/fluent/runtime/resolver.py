@@ -1,30 +1,35 @@
 from __future__ import absolute_import, unicode_literals
 
-import contextlib
+import sys
+import threading
 from datetime import date, datetime
 from decimal import Decimal
 
-import attr
 import six
 
-from fluent.syntax import ast as FTL
 from .errors import FluentCyclicReferenceError, FluentFormatError, FluentReferenceError
 from .types import FluentType, FluentNone, FluentInt, FluentFloat
-from .utils import reference_to_id, unknown_reference_error_obj
+from .utils import ATTRIBUTE_SEPARATOR, TERM_SIGIL, unknown_reference_error_obj
 
 
 """
 The classes in this module are used to transform the source
-AST to a partially evaluated resolver tree. They're subclasses
-to the syntax AST node, and `BaseResolver`. Syntax nodes that
-don't require special handling, but have children that need to be
-transformed, need to just inherit from their syntax base class and
-`BaseResolver`. When adding to the module namespace here, watch
-out for naming conflicts with `fluent.syntax.ast`.
+AST to a partially evaluated resolver tree. Each syntax node
+class that can appear in a compiled message has a class of the
+same name here, which is a `BaseResolver`. They take the same
+constructor arguments as the syntax node, but only keep the fields
+that are needed to evaluate them, in `__slots__`. Spans, comments
+and other syntax-only information are dropped. When adding to the
+module namespace here, watch out for naming conflicts with
+`fluent.syntax.ast`.
 
 `ResolverEnvironment` is the `env` passed to the `__call__` method
-in the resolver tree. The `CurrentEnvironment` keeps track of the
-modifyable state in the resolver environment.
+in the resolver tree. It keeps track of the args, which are modified
+temporarily while evaluating terms.
+
+The resolver tree itself is never modified after compilation, all state
+needed while formatting lives in the environment. This means a tree can be
+evaluated by several threads at once.
 """
 
 
@@ -32,46 +37,86 @@ modifyable state in the resolver environment.
 MAX_PART_LENGTH = 2500
 
 
-@attr.s
-class CurrentEnvironment(object):
-    # The parts of ResolverEnvironment that we want to mutate (and restore)
-    # temporarily for some parts of a call chain.
+class ResolverEnvironment(object):
+    """
+    The state used while formatting a message.
 
-    # The values of attributes here must not be mutated, they must only be
-    # swapped out for different objects using `modified` (see below).
+    `args` are the args for VariableReference nodes. For Messages these are
+    the external args, but for Terms they are the values explicitly passed
+    using CallExpression syntax, so they are swapped out using `push_args`
+    and `pop_args` while a term is evaluated. `error_for_missing_arg`
+    controls whether we need to report an error if a VariableReference refers
+    to an arg that is not present in `args`.
 
-    # For Messages, VariableReference nodes are interpreted as external args,
-    # but for Terms they are the values explicitly passed using CallExpression
-    # syntax. So we have to be able to change 'args' for this purpose.
-    args = attr.ib()
-    # This controls whether we need to report an error if a VariableReference
-    # refers to an arg that is not present in the args dict.
-    error_for_missing_arg = attr.ib(default=True)
+    The values of `args` must not be mutated, only swapped for different
+    objects.
+    """
+    __slots__ = ['context', 'errors', 'part_count', 'args', 'error_for_missing_arg',
+                 'active_patterns', 'arg_stack']
+
+    def __init__(self, context, errors, args=None, error_for_missing_arg=True):
+        self.context = context
+        self.errors = errors
+        self.part_count = 0
+        self.args = args if args is not None else {}
+        self.error_for_missing_arg = error_for_missing_arg
+        # The Patterns currently being evaluated, for cycle detection. This is
+        # per-call state, so that many threads can use the same resolver tree.
+        self.active_patterns = set()
+        # Saved args and error_for_missing_arg values, alternating
+        self.arg_stack = []
+
+    def push_args(self, args, error_for_missing_arg=False):
+        self.arg_stack.append(self.args)
+        self.arg_stack.append(self.error_for_missing_arg)
+        self.args = args
+        self.error_for_missing_arg = error_for_missing_arg
+
+    def pop_args(self):
+        self.error_for_missing_arg = self.arg_stack.pop()
+        self.args = self.arg_stack.pop()
+
+    def reset(self, args, errors):
+        """
+        Prepares the environment for formatting another message
+        """
+        self.args = args
+        self.errors = errors
+        self.part_count = 0
+        self.error_for_missing_arg = True
+        if self.active_patterns:
+            self.active_patterns.clear()
+        if self.arg_stack:
+            del self.arg_stack[:]
 
 
-@attr.s
-class ResolverEnvironment(object):
-    context = attr.ib()
-    errors = attr.ib()
-    part_count = attr.ib(default=0)
-    current = attr.ib(factory=CurrentEnvironment)
+class EnvironmentPool(threading.local):
+    """
+    Free `ResolverEnvironment` objects for a FluentBundle, kept per thread so
+    that formatting doesn't need to create new ones. A pool can hand out
+    several environments at once, for when a message is formatted while
+    formatting another one (e.g. from a custom function).
+    """
+    def __init__(self, context):
+        self.context = context
+        self.free = []
 
-    @contextlib.contextmanager
-    def modified(self, **replacements):
-        """
-        Context manager that modifies the 'current' attribute of the
-        environment, restoring the old data at the end.
-        """
-        # CurrentEnvironment only has args that we never mutate, so the shallow
-        # copy returned by attr.evolve is fine (at least for now).
-        old_current = self.current
-        self.current = attr.evolve(old_current, **replacements)
-        yield self
-        self.current = old_current
+    def acquire(self, args, errors):
+        try:
+            env = self.free.pop()
+        except IndexError:
+            return ResolverEnvironment(self.context, errors, args)
+        env.reset(args, errors)
+        return env
 
-    def modified_for_term_reference(self, args=None):
-        return self.modified(args=args if args is not None else {},
-                             error_for_missing_arg=False)
+    def release(self, env):
+        # Don't keep args and errors alive
+        env.args = env.errors = None
+        self.free.append(env)
+
+
+# Args for term references without arguments. Never mutated.
+NO_ARGS = {}
 
 
 class BaseResolver(object):
@@ -82,38 +127,58 @@ class BaseResolver(object):
     ResolverEnvironment as parameter. An exception are wrapper
     classes that don't show up in the evaluation, but need to
     be part of the compiled tree structure.
+
+    Subclasses keep their fields in `__slots__`, to keep compiled
+    messages small.
     """
+    __slots__ = ()
+
     def __call__(self, env):
         raise NotImplementedError
 
 
+def node_fields(node):
+    """
+    Returns a list of (name, value) pairs for the fields of a resolver node
+    """
+    return [(name, getattr(node, name))
+            for cls in type(node).__mro__
+            for name in cls.__dict__.get('__slots__', ())]
+
+
 class Literal(BaseResolver):
-    pass
+    __slots__ = ()
+
 
+class Message(BaseResolver):
+    __slots__ = ['id', 'value', 'attributes']
 
-class Message(FTL.Message, BaseResolver):
-    pass
+    def __init__(self, id, value=None, attributes=None, **kwargs):
+        self.id = id
+        self.value = value
+        self.attributes = attributes or []
 
 
-class Term(FTL.Term, BaseResolver):
-    pass
+class Term(Message):
+    __slots__ = ()
 
 
-class Pattern(FTL.Pattern, BaseResolver):
+class Pattern(BaseResolver):
+    __slots__ = ['elements']
+
     # Prevent messages with too many sub parts, for CPI DOS protection
     MAX_PARTS = 1000
 
-    def __init__(self, *args, **kwargs):
-        super(Pattern, self).__init__(*args, **kwargs)
-        self.dirty = False
+    def __init__(self, elements, **kwargs):
+        self.elements = elements
 
     def __call__(self, env):
-        if self.dirty:
+        if self in env.active_patterns:
             env.errors.append(FluentCyclicReferenceError("Cyclic reference"))
             return FluentNone()
         if env.part_count > self.MAX_PARTS:
             return ""
-        self.dirty = True
+        env.active_patterns.add(self)
         elements = self.elements
         remaining_parts = self.MAX_PARTS - env.part_count
         if len(self.elements) > remaining_parts:
@@ -124,7 +189,7 @@ class Pattern(FTL.Pattern, BaseResolver):
             resolve(element(env), env) for element in elements
         )
         env.part_count += len(elements)
-        self.dirty = False
+        env.active_patterns.discard(self)
         return retval
 
 
@@ -137,86 +202,188 @@ def resolve(fluentish, env):
     return fluentish
 
 
-class TextElement(FTL.TextElement, Literal):
+class TextElement(Literal):
+    __slots__ = ['value']
+
+    def __init__(self, value, **kwargs):
+        self.value = value
+
     def __call__(self, env):
         return self.value
 
 
-class Placeable(FTL.Placeable, BaseResolver):
+class InlinedText(TextElement):
+    """
+    Static text that includes the text of other messages, which were
+    inlined at compile time.
+    """
+    __slots__ = ()
+
+
+class Placeable(BaseResolver):
+    __slots__ = ['expression']
+
+    def __init__(self, expression, **kwargs):
+        self.expression = expression
+
     def __call__(self, env):
         return self.expression(env)
 
 
-class IsolatingPlaceable(FTL.Placeable, BaseResolver):
+class IsolatingPlaceable(Placeable):
+    __slots__ = ()
+
     def __call__(self, env):
         inner = self.expression(env)
         return "\u2068" + resolve(inner, env) + "\u2069"
 
 
-class StringLiteral(FTL.StringLiteral, Literal):
-    def __call__(self, env):
-        return self.value
+class StringLiteral(TextElement):
+    __slots__ = ()
+
 
+class NumberLiteral(BaseResolver):
+    __slots__ = ['value']
 
-class NumberLiteral(FTL.NumberLiteral, BaseResolver):
     def __init__(self, value, **kwargs):
-        super(NumberLiteral, self).__init__(value, **kwargs)
-        if '.' in self.value:
-            self.value = FluentFloat(self.value)
+        if '.' in value:
+            self.value = FluentFloat(value)
         else:
-            self.value = FluentInt(self.value)
+            self.value = FluentInt(value)
 
     def __call__(self, env):
         return self.value
 
 
-class MessageReference(FTL.MessageReference, BaseResolver):
+class EntryReference(BaseResolver):
+    """
+    Base class for references to messages, terms and their attributes.
+
+    References are linked to the compiled target the first time they are
+    used, so they don't have to look it up again on every call. If the target
+    doesn't exist, they are linked to a fallback instead, and report an error
+    on every call. The bundle unlinks references to missing targets when new
+    messages are added, because they might now exist.
+
+    `ref_id` is the id of the target, e.g. `message.attr` or `-term`.
+    """
+    __slots__ = ['ref_id', 'target', 'missing_id']
+
+    def __init__(self, ref_id):
+        self.ref_id = ref_id
+        self.target = None
+        self.missing_id = None
+
+    def resolve_reference(self, env):
+        """
+        Returns the compiled target, or a fallback if not found
+        """
+        target = self.target
+        if target is None:
+            target = self.link(env.context)
+        missing_id = self.missing_id
+        if missing_id is not None:
+            env.errors.append(unknown_reference_error_obj(missing_id))
+        return target
+
+    def link(self, context):
+        ref_id = self.ref_id
+        try:
+            target = context.lookup(ref_id)
+        except LookupError:
+            target = self.fallback(context, ref_id)
+            # The error must be visible before the target is, for the benefit
+            # of other threads.
+            self.missing_id = ref_id
+            context._fallback_links.append(self)
+        self.target = target
+        return target
+
+    def fallback(self, context, ref_id):
+        return FluentNoneResolver(ref_id)
+
+    def unlink(self):
+        self.target = None
+        self.missing_id = None
+
+    def __getstate__(self):
+        # Links are only valid for the bundle they were made in, so they
+        # aren't pickled, and are made again when the reference is used.
+        return {name: value for name, value in node_fields(self)
+                if name not in ('target', 'missing_id')}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.unlink()
+
+
+class MessageReference(EntryReference):
+    __slots__ = ()
+
+    def __init__(self, id, **kwargs):
+        super(MessageReference, self).__init__(id.name)
+
     def __call__(self, env):
-        return lookup_reference(self, env)(env)
+        return self.resolve_reference(env)(env)
 
 
-class TermReference(FTL.TermReference, BaseResolver):
+class TermReference(EntryReference):
+    __slots__ = ()
+
+    def __init__(self, id, **kwargs):
+        super(TermReference, self).__init__(TERM_SIGIL + id.name)
+
     def __call__(self, env):
-        with env.modified_for_term_reference():
-            return lookup_reference(self, env)(env)
+        env.push_args(NO_ARGS)
+        try:
+            return self.resolve_reference(env)(env)
+        finally:
+            env.pop_args()
 
 
 class FluentNoneResolver(FluentNone, BaseResolver):
+    # Created while formatting, so doesn't need to be compact
     def __call__(self, env):
         return self.format(env.context._babel_locale)
 
 
-def lookup_reference(ref, env):
+def freeze_tree(node, context):
     """
-    Given a MessageReference, TermReference or AttributeExpression, returns the
-    AST node, or FluentNone if not found, including fallback logic
+    Prepares the resolver tree `node` for being shared between processes,
+    by linking all references in it now, so that they are never written to
+    again, using tuples instead of lists, and interning strings.
     """
-    ref_id = reference_to_id(ref)
-    try:
-        return env.context.lookup(ref_id)
-    except LookupError:
-        env.errors.append(unknown_reference_error_obj(ref_id))
-
-        if isinstance(ref, AttributeExpression):
-            # Fallback
-            parent_id = reference_to_id(ref.ref)
-            try:
-                return env.context.lookup(parent_id)
-            except LookupError:
-                # Don't add error here, because we already added error for the
-                # actual thing we were looking for.
-                pass
-
-    return FluentNoneResolver(ref_id)
-
+    if isinstance(node, EntryReference) and node.target is None:
+        node.link(context)
+    for name, value in node_fields(node):
+        if name == 'target':
+            continue
+        if isinstance(node, AttributeExpression) and name == 'ref':
+            # Never evaluated by itself
+            continue
+        if isinstance(value, list):
+            value = tuple(value)
+            setattr(node, name, value)
+        elif six.PY3 and type(value) is str:
+            setattr(node, name, sys.intern(value))
+        for child in value if isinstance(value, tuple) else [value]:
+            if isinstance(child, BaseResolver):
+                freeze_tree(child, context)
+
+
+class VariableReference(BaseResolver):
+    __slots__ = ['id']
+
+    def __init__(self, id, **kwargs):
+        self.id = id
 
-class VariableReference(FTL.VariableReference, BaseResolver):
     def __call__(self, env):
         name = self.id.name
         try:
-            arg_val = env.current.args[name]
+            arg_val = env.args[name]
         except LookupError:
-            if env.current.error_for_missing_arg:
+            if env.error_for_missing_arg:
                 env.errors.append(
                     FluentReferenceError("Unknown external: {0}".format(name)))
             return FluentNoneResolver(name)
@@ -228,16 +395,40 @@ class VariableReference(FTL.VariableReference, BaseResolver):
         return FluentNone(name)
 
 
-class AttributeExpression(FTL.AttributeExpression, BaseResolver):
+class AttributeExpression(EntryReference):
+    __slots__ = ['ref']
+
+    def __init__(self, ref, name, **kwargs):
+        super(AttributeExpression, self).__init__(
+            ATTRIBUTE_SEPARATOR.join([ref.ref_id, name.name]))
+        self.ref = ref
+
     def __call__(self, env):
-        return lookup_reference(self, env)(env)
+        return self.resolve_reference(env)(env)
+
+    def fallback(self, context, ref_id):
+        # Use the parent message or term instead. If that doesn't exist either,
+        # we don't add another error, as we already report the attribute.
+        try:
+            return context.lookup(self.ref.ref_id)
+        except LookupError:
+            return FluentNoneResolver(ref_id)
+
 
+class Attribute(BaseResolver):
+    __slots__ = ['id', 'value']
 
-class Attribute(FTL.Attribute, BaseResolver):
-    pass
+    def __init__(self, id, value, **kwargs):
+        self.id = id
+        self.value = value
 
 
-class VariantList(FTL.VariantList, BaseResolver):
+class VariantList(BaseResolver):
+    __slots__ = ['variants']
+
+    def __init__(self, variants, **kwargs):
+        self.variants = variants
+
     def __call__(self, env, key=None):
         found = None
         for variant in self.variants:
@@ -262,25 +453,62 @@ class VariantList(FTL.VariantList, BaseResolver):
         return found.value(env)
 
 
-class SelectExpression(FTL.SelectExpression, BaseResolver):
+class SelectExpression(BaseResolver):
+    __slots__ = ['selector', 'variants', 'string_keys', 'number_keys', 'default_index']
+
+    def __init__(self, selector, variants, **kwargs):
+        self.selector = selector
+        self.variants = variants
+        # Variant keys are constant, so we can index them up front, instead of
+        # comparing with each variant in turn. The indexes map keys to the
+        # position of the first variant with that key, so that we can still
+        # choose the first matching variant when a key matches more than one
+        # way (e.g. `[1]` and `[one]`).
+        self.string_keys = {}
+        self.number_keys = {}
+        for index, variant in enumerate(variants):
+            if variant.default:
+                self.default_index = index
+            variant_key = variant.key(None)
+            if is_number(variant_key):
+                self.number_keys.setdefault(variant_key, index)
+            else:
+                self.string_keys.setdefault(variant_key, index)
+
     def __call__(self, env):
         key = self.selector(env)
         return self.select_from_select_expression(env, key=key)
 
     def select_from_select_expression(self, env, key):
-        default = None
-        found = None
-        for variant in self.variants:
-            if variant.default:
-                default = variant
+        return self.variants[self.select_index(env, key)].value(env)
 
-            if match(key, variant.key(env), env):
-                found = variant
-                break
+    def select_index(self, env, key):
+        """
+        Returns the index of the variant matching `key`, as per `match`.
+        """
+        if key is None or isinstance(key, FluentNone):
+            return self.default_index
+        if is_number(key):
+            found = self.number_keys.get(key)
+            if self.string_keys:
+                plural_match = self.string_keys.get(env.context._plural_form(key))
+                if plural_match is not None and (found is None or plural_match < found):
+                    found = plural_match
+        elif isinstance(key, six.string_types):
+            found = self.string_keys.get(key)
+            for variant_key, index in self.number_keys.items():
+                if (found is None or index < found) and match(variant_key, key, env):
+                    found = index
+        else:
+            found = None
+            for index, variant in enumerate(self.variants):
+                if match(key, variant.key(env), env):
+                    found = index
+                    break
 
         if found is None:
-            found = default
-        return found.value(env)
+            return self.default_index
+        return found
 
 
 def is_number(val):
@@ -302,18 +530,34 @@ def match(val1, val2, env):
     return val1 == val2
 
 
-class Variant(FTL.Variant, BaseResolver):
-    pass
+class Variant(BaseResolver):
+    __slots__ = ['key', 'value', 'default']
+
+    def __init__(self, key, value, default=False, **kwargs):
+        self.key = key
+        self.value = value
+        self.default = default
 
 
-class Identifier(FTL.Identifier, BaseResolver):
+class Identifier(BaseResolver):
+    __slots__ = ['name']
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+
     def __call__(self, env):
         return self.name
 
 
-class VariantExpression(FTL.VariantExpression, BaseResolver):
+class VariantExpression(BaseResolver):
+    __slots__ = ['ref', 'key']
+
+    def __init__(self, ref, key, **kwargs):
+        self.ref = ref
+        self.key = key
+
     def __call__(self, env):
-        message = lookup_reference(self.ref, env)
+        message = self.ref.resolve_reference(env)
 
         # TODO What to do if message is not a VariantList?
         # Need test at least.
@@ -323,18 +567,35 @@ class VariantExpression(FTL.VariantExpression, BaseResolver):
         return message(env, variant_name)
 
 
-class CallExpression(FTL.CallExpression, BaseResolver):
+class FunctionReference(BaseResolver):
+    __slots__ = ['id']
+
+    def __init__(self, id, **kwargs):
+        self.id = id
+
+
+class CallExpression(BaseResolver):
+    __slots__ = ['callee', 'positional', 'named']
+
+    def __init__(self, callee, positional=None, named=None, **kwargs):
+        self.callee = callee
+        self.positional = positional or []
+        self.named = named or []
+
     def __call__(self, env):
         args = [arg(env) for arg in self.positional]
         kwargs = {kwarg.name.name: kwarg.value(env) for kwarg in self.named}
 
         if isinstance(self.callee, (TermReference, AttributeExpression)):
-            term = lookup_reference(self.callee, env)
+            term = self.callee.resolve_reference(env)
             if args:
                 env.errors.append(FluentFormatError("Ignored positional arguments passed to term '{0}'"
-                                                    .format(reference_to_id(self.callee))))
-            with env.modified_for_term_reference(args=kwargs):
+                                                    .format(self.callee.ref_id)))
+            env.push_args(kwargs)
+            try:
                 return term(env)
+            finally:
+                env.pop_args()
 
         # builtin or custom function call
         function_name = self.callee.id.name
@@ -352,5 +613,9 @@ class CallExpression(FTL.CallExpression, BaseResolver):
             return FluentNoneResolver(function_name + "()")
 
 
-class NamedArgument(FTL.NamedArgument, BaseResolver):
-    pass
+class NamedArgument(BaseResolver):
+    __slots__ = ['name', 'value']
+
+    def __init__(self, name, value, **kwargs):
+        self.name = name
+        self.value = value
@@ -0,0 +1,71 @@
+from __future__ import absolute_import, unicode_literals
+
+import gc
+import hashlib
+
+from six.moves import cPickle as pickle
+
+"""
+Reading and writing snapshots of the compiled state of a FluentBundle.
+
+A snapshot file is a header line, followed by a pickle of the state:
+
+    fluent.runtime snapshot <version> <sha256 of the pickle>\n
+
+The hash is checked on loading to detect truncated or corrupted files. It
+does not make it safe to load snapshots from untrusted sources, which is
+never safe to do with pickles.
+"""
+
+MAGIC = b'fluent.runtime snapshot'
+
+# Increase when the contents of snapshots, or the resolver classes they
+# contain, change in a way that makes older snapshots unusable.
+SNAPSHOT_VERSION = 2
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def write_snapshot(fileobj, state):
+    """
+    Writes the `state` dictionary to the binary file object `fileobj`
+    """
+    payload = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+    header = b' '.join([MAGIC,
+                        str(SNAPSHOT_VERSION).encode('ascii'),
+                        hashlib.sha256(payload).hexdigest().encode('ascii')])
+    fileobj.write(header + b'\n')
+    fileobj.write(payload)
+
+
+def read_snapshot(fileobj):
+    """
+    Reads a state dictionary written by `write_snapshot` from the binary file
+    object `fileobj`. Raises SnapshotError if it is not a valid snapshot for
+    this version of fluent.runtime.
+    """
+    header = fileobj.readline()
+    if not header.startswith(MAGIC + b' '):
+        raise SnapshotError("Not a fluent.runtime snapshot")
+    try:
+        version, digest = header[len(MAGIC) + 1:].split()
+        version = int(version)
+    except ValueError:
+        raise SnapshotError("Invalid snapshot header")
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError("Unsupported snapshot version {0}, expected {1}"
+                            .format(version, SNAPSHOT_VERSION))
+    payload = fileobj.read()
+    if hashlib.sha256(payload).hexdigest().encode('ascii') != digest:
+        raise SnapshotError("Snapshot is corrupted, content hash does not match")
+    # Unpickling creates lots of objects and no garbage, which would make the
+    # garbage collector run many times for nothing.
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.loads(payload)
+    finally:
+        if gc_enabled:
+            gc.enable()
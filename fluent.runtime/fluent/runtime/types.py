@@ -1,15 +1,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import re
 import warnings
 from datetime import date, datetime
 from decimal import Decimal
 
 import attr
 import pytz
-from babel.dates import format_date, format_time, get_datetime_format, get_timezone
+from babel.dates import (format_date, format_time, get_date_format, get_datetime_format, get_time_format,
+                         get_timezone)
 from babel.numbers import NumberPattern, parse_pattern
 
+from .cache import BoundedCache
+
 FORMAT_STYLE_DECIMAL = "decimal"
 FORMAT_STYLE_CURRENCY = "currency"
 FORMAT_STYLE_PERCENT = "percent"
@@ -61,7 +65,7 @@ class FluentNone(FluentType):
         return self.name or "???"
 
 
-@attr.s
+@attr.s(frozen=True, cache_hash=True)
 class NumberFormatOptions(object):
     # We follow the Intl.NumberFormat parameter names here,
     # rather than using underscores as per PEP8, so that
@@ -102,70 +106,88 @@ class FluentNumber(FluentType):
         return self
 
     def format(self, locale):
-        if self.options.style == FORMAT_STYLE_DECIMAL:
-            base_pattern = locale.decimal_formats.get(None)
-            pattern = self._apply_options(base_pattern)
-            return pattern.apply(self, locale)
-        elif self.options.style == FORMAT_STYLE_PERCENT:
-            base_pattern = locale.percent_formats.get(None)
-            pattern = self._apply_options(base_pattern)
-            return pattern.apply(self, locale)
-        elif self.options.style == FORMAT_STYLE_CURRENCY:
-            base_pattern = locale.currency_formats['standard']
-            pattern = self._apply_options(base_pattern)
+        pattern = _number_pattern_cache.get((locale, self.options), _create_number_pattern)
+        if self.options.style == FORMAT_STYLE_CURRENCY:
             return pattern.apply(self, locale, currency=self.options.currency)
+        return pattern.apply(self, locale)
+
+
+# Ready to use NumberPattern objects, keyed on (locale, NumberFormatOptions).
+NUMBER_PATTERN_CACHE_SIZE = 1000
+
+_number_pattern_cache = BoundedCache(NUMBER_PATTERN_CACHE_SIZE)
 
-    def _apply_options(self, pattern):
-        # We are essentially trying to copy the
-        # https://developer.mozilla.org/en-US/docs/Web/JavaScript/Reference/Global_Objects/NumberFormat
-        # API using Babel number formatting routines, which is slightly awkward
-        # but not too bad as they are both based on Unicode standards.
-
-        # The easiest route is to start from the existing NumberPattern, and
-        # then change its attributes so that Babel's number formatting routines
-        # do the right thing. The NumberPattern.pattern string then becomes
-        # incorrect, but it is not used when formatting, it is only used
-        # initially to set the other attributes.
-        pattern = clone_pattern(pattern)
-        if not self.options.useGrouping:
-            pattern.grouping = _UNGROUPED_PATTERN.grouping
-        if self.options.style == FORMAT_STYLE_CURRENCY:
-            if self.options.currencyDisplay == CURRENCY_DISPLAY_CODE:
-                # Not sure of the correct algorithm here, but this seems to
-                # work:
-                def replacer(s):
-                    return s.replace("¤", "¤¤")
-                pattern.suffix = (replacer(pattern.suffix[0]),
-                                  replacer(pattern.suffix[1]))
-                pattern.prefix = (replacer(pattern.prefix[0]),
-                                  replacer(pattern.prefix[1]))
-            elif self.options.currencyDisplay == CURRENCY_DISPLAY_NAME:
-                # No support for this yet - see
-                # https://github.com/python-babel/babel/issues/578 But it's
-                # better to display something than crash or a generic fallback
-                # string, so we just issue a warning and carry on for now.
-                warnings.warn("Unsupported currencyDisplayValue {0}, falling back to {1}"
-                              .format(CURRENCY_DISPLAY_NAME,
-                                      CURRENCY_DISPLAY_SYMBOL))
-        if (self.options.minimumSignificantDigits is not None
-                or self.options.maximumSignificantDigits is not None):
-            # This triggers babel routines into 'significant digits' mode:
-            pattern.pattern = '@'
-            # We then manually set int_prec, and leave the rest as they are.
-            min_digits = (1 if self.options.minimumSignificantDigits is None
-                          else self.options.minimumSignificantDigits)
-            max_digits = (min_digits if self.options.maximumSignificantDigits is None
-                          else self.options.maximumSignificantDigits)
-            pattern.int_prec = (min_digits, max_digits)
-        else:
-            if self.options.minimumIntegerDigits is not None:
-                pattern.int_prec = (self.options.minimumIntegerDigits, pattern.int_prec[1])
-            if self.options.minimumFractionDigits is not None:
-                pattern.frac_prec = (self.options.minimumFractionDigits, pattern.frac_prec[1])
-            if self.options.maximumFractionDigits is not None:
-                pattern.frac_prec = (pattern.frac_prec[0], self.options.maximumFractionDigits)
 
-        return pattern
+def number_pattern_cache_info():
+    """
+    Returns hits, misses, maxsize and currsize of the number pattern cache,
+    as a named tuple.
+    """
+    return _number_pattern_cache.info()
+
+
+def _create_number_pattern(key):
+    locale, options = key
+    if options.style == FORMAT_STYLE_DECIMAL:
+        base_pattern = locale.decimal_formats.get(None)
+    elif options.style == FORMAT_STYLE_PERCENT:
+        base_pattern = locale.percent_formats.get(None)
+    elif options.style == FORMAT_STYLE_CURRENCY:
+        base_pattern = locale.currency_formats['standard']
+    return _apply_number_options(base_pattern, options)
+
+
+def _apply_number_options(pattern, options):
+    # We are essentially trying to copy the
+    # https://developer.mozilla.org/en-US/docs/Web/JavaScript/Reference/Global_Objects/NumberFormat
+    # API using Babel number formatting routines, which is slightly awkward
+    # but not too bad as they are both based on Unicode standards.
+
+    # The easiest route is to start from the existing NumberPattern, and
+    # then change its attributes so that Babel's number formatting routines
+    # do the right thing. The NumberPattern.pattern string then becomes
+    # incorrect, but it is not used when formatting, it is only used
+    # initially to set the other attributes.
+    pattern = clone_pattern(pattern)
+    if not options.useGrouping:
+        pattern.grouping = _UNGROUPED_PATTERN.grouping
+    if options.style == FORMAT_STYLE_CURRENCY:
+        if options.currencyDisplay == CURRENCY_DISPLAY_CODE:
+            # Not sure of the correct algorithm here, but this seems to
+            # work:
+            def replacer(s):
+                return s.replace("¤", "¤¤")
+            pattern.suffix = (replacer(pattern.suffix[0]),
+                              replacer(pattern.suffix[1]))
+            pattern.prefix = (replacer(pattern.prefix[0]),
+                              replacer(pattern.prefix[1]))
+        elif options.currencyDisplay == CURRENCY_DISPLAY_NAME:
+            # No support for this yet - see
+            # https://github.com/python-babel/babel/issues/578 But it's
+            # better to display something than crash or a generic fallback
+            # string, so we just issue a warning and carry on for now.
+            warnings.warn("Unsupported currencyDisplayValue {0}, falling back to {1}"
+                          .format(CURRENCY_DISPLAY_NAME,
+                                  CURRENCY_DISPLAY_SYMBOL))
+    if (options.minimumSignificantDigits is not None
+            or options.maximumSignificantDigits is not None):
+        # This triggers babel routines into 'significant digits' mode:
+        pattern.pattern = '@'
+        # We then manually set int_prec, and leave the rest as they are.
+        min_digits = (1 if options.minimumSignificantDigits is None
+                      else options.minimumSignificantDigits)
+        max_digits = (min_digits if options.maximumSignificantDigits is None
+                      else options.maximumSignificantDigits)
+        pattern.int_prec = (min_digits, max_digits)
+    else:
+        if options.minimumIntegerDigits is not None:
+            pattern.int_prec = (options.minimumIntegerDigits, pattern.int_prec[1])
+        if options.minimumFractionDigits is not None:
+            pattern.frac_prec = (options.minimumFractionDigits, pattern.frac_prec[1])
+        if options.maximumFractionDigits is not None:
+            pattern.frac_prec = (pattern.frac_prec[0], options.maximumFractionDigits)
+
+    return pattern
 
 
 def merge_options(options_class, base, kwargs):
@@ -174,24 +196,15 @@ def merge_options(options_class, base, kwargs):
     and some keyword arguments, create a new options instance
     """
     if base is not None and not kwargs:
-        # We can safely re-use base, because we don't
-        # mutate options objects outside this function.
+        # We can safely re-use base, because options objects are immutable.
         return base
 
-    retval = options_class()
+    if base is None:
+        return options_class(**kwargs)
 
-    if base is not None:
-        # We only copy values in `__dict__` to avoid class attributes.
-        retval.__dict__.update(base.__dict__)
-
-    # Use the options_class constructor because it might
-    # have validators defined for the fields.
-    kwarg_options = options_class(**kwargs)
-    # Then merge, using only the ones explicitly given as keyword params.
-    for k in kwargs.keys():
-        setattr(retval, k, getattr(kwarg_options, k))
-
-    return retval
+    # evolve uses the options_class constructor, so that validators defined
+    # for the fields are run.
+    return attr.evolve(base, **kwargs)
 
 
 # We want types that inherit from both FluentNumber and a native type,
@@ -246,7 +259,7 @@ def clone_pattern(pattern):
                          pattern.exp_plus)
 
 
-@attr.s
+@attr.s(frozen=True, cache_hash=True)
 class DateFormatOptions(object):
     # Parameters.
     # See https://projectfluent.org/fluent/guide/functions.html#datetime
@@ -293,28 +306,70 @@ class FluentDateType(FluentType):
                 warnings.warn("FluentDateType option {0} is not yet supported".format(k))
 
     def format(self, locale):
-        if isinstance(self, datetime):
-            selftz = _ensure_datetime_tzinfo(self, tzinfo=self.options.timeZone)
-        else:
-            selftz = self
-
-        if self.options.dateStyle is None and self.options.timeStyle is None:
-            return format_date(selftz, format='medium', locale=locale)
-        elif self.options.dateStyle is None and self.options.timeStyle is not None:
-            return format_time(selftz, format=self.options.timeStyle, locale=locale)
-        elif self.options.dateStyle is not None and self.options.timeStyle is None:
-            return format_date(selftz, format=self.options.dateStyle, locale=locale)
+        formatter = _date_formatter_cache.get((locale, self.options), DateFormatter)
+        return formatter.format(self)
+
+
+class DateFormatter(object):
+    """
+    Formats dates for a (locale, DateFormatOptions) pair, with the patterns
+    and timezone looked up and parsed in advance.
+    """
+    def __init__(self, key):
+        locale, options = key
+        self.locale = locale
+        self.date_style = options.dateStyle
+        self.time_style = options.timeStyle
+        if options.timeZone is not None:
+            self.timezone = get_timezone(options.timeZone)
         else:
+            self.timezone = None
+        # Babel functions accept DateTimePattern objects as formats and use
+        # them directly, which avoids looking up and parsing CLDR patterns on
+        # every call.
+        if self.date_style is None and self.time_style is None:
+            self.date_pattern = get_date_format('medium', locale=locale)
+        elif self.date_style is not None:
+            self.date_pattern = get_date_format(self.date_style, locale=locale)
+        if self.time_style is not None:
+            self.time_pattern = get_time_format(self.time_style, locale=locale)
+        if self.date_style is not None and self.time_style is not None:
             # Both date and time. Logic copied from babel.dates.format_datetime,
             # with modifications.
             # Which datetime format do we pick? We arbitrarily pick dateStyle.
+            datetime_format = get_datetime_format(self.date_style, locale=locale).replace("'", "")
+            self.datetime_parts = _DATETIME_FORMAT_PLACEHOLDERS_RE.split(datetime_format)
+
+    def format(self, dt):
+        if isinstance(dt, datetime):
+            dt = _ensure_datetime_tzinfo(dt, tzinfo=self.timezone)
+
+        if self.time_style is None:
+            return format_date(dt, format=self.date_pattern, locale=self.locale)
+        elif self.date_style is None:
+            return format_time(dt, format=self.time_pattern, locale=self.locale)
+        else:
+            formatted = {
+                '{0}': format_time(dt, self.time_pattern, tzinfo=None, locale=self.locale),
+                '{1}': format_date(dt, self.date_pattern, locale=self.locale),
+            }
+            return ''.join(formatted.get(part, part) for part in self.datetime_parts)
 
-            return (get_datetime_format(self.options.dateStyle, locale=locale)
-                    .replace("'", "")
-                    .replace('{0}', format_time(selftz, self.options.timeStyle, tzinfo=None,
-                                                locale=locale))
-                    .replace('{1}', format_date(selftz, self.options.dateStyle, locale=locale))
-                    )
+
+_DATETIME_FORMAT_PLACEHOLDERS_RE = re.compile(r'(\{0\}|\{1\})')
+
+# DateFormatter objects, keyed on (locale, DateFormatOptions).
+DATE_FORMATTER_CACHE_SIZE = 1000
+
+_date_formatter_cache = BoundedCache(DATE_FORMATTER_CACHE_SIZE)
+
+
+def date_formatter_cache_info():
+    """
+    Returns hits, misses, maxsize and currsize of the date formatter cache,
+    as a named tuple.
+    """
+    return _date_formatter_cache.info()
 
 
 def _ensure_datetime_tzinfo(dt, tzinfo=None):
@@ -325,9 +380,9 @@ def _ensure_datetime_tzinfo(dt, tzinfo=None):
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=pytz.UTC)
     if tzinfo is not None:
-        dt = dt.astimezone(get_timezone(tzinfo))
+        dt = dt.astimezone(tzinfo)
         if hasattr(tzinfo, 'normalize'):  # pytz
-            dt = tzinfo.normalize(datetime)
+            dt = tzinfo.normalize(dt)
     return dt
 
 
@@ -1,17 +1,39 @@
 from __future__ import absolute_import, unicode_literals
 
+import re
 from datetime import date, datetime
 from decimal import Decimal
 
-from fluent.syntax.ast import AttributeExpression, Term, TermReference
+from fluent.syntax import FluentParser
+from fluent.syntax.ast import AttributeExpression, Message, Term, TermReference, Visitor
 
-from .types import FluentInt, FluentFloat, FluentDecimal, FluentDate, FluentDateTime
+from .types import FluentInt, FluentFloat, FluentDecimal, FluentDate, FluentDateTime, FluentType
 from .errors import FluentReferenceError
 
 TERM_SIGIL = '-'
 ATTRIBUTE_SEPARATOR = '.'
 
 
+def _identity(val):
+    return val
+
+
+# Functions that convert Python types to Fluent types, used by
+# `native_to_fluent`. A value whose type isn't listed here uses the converter
+# for the nearest base class that is. Add to this using `register_converter`.
+NATIVE_TO_FLUENT = {
+    FluentType: _identity,
+    int: FluentInt,
+    float: FluentFloat,
+    Decimal: FluentDecimal,
+    datetime: FluentDateTime.from_date_time,
+    date: FluentDate.from_date,
+}
+
+# Converter (or None) for every type seen so far, including subclasses.
+_converters_by_type = {}
+
+
 def ast_to_id(ast):
     """
     Returns a string reference for a Term or Message
@@ -21,22 +43,95 @@ def ast_to_id(ast):
     return ast.id.name
 
 
+# The start of a line that begins a message, a term or a comment
+ENTRY_START_RE = re.compile(r'^(?:(-?[a-zA-Z][a-zA-Z0-9_-]*) *=|#)', re.MULTILINE)
+
+# A line with only an identifier on it. This starts a message in the old
+# syntax (attributes on the following lines, without `=` after the id), but
+# can also be part of a multiline placeable.
+BARE_IDENTIFIER_RE = re.compile(r'^-?[a-zA-Z][a-zA-Z0-9_-]* *\r?$', re.MULTILINE)
+
+
+def scan_entries(source):
+    """
+    Finds the messages and terms in FTL source without parsing them. Returns a
+    list of (id, start, end) tuples, where `source[start:end]` is the text of
+    the message or term, which can be parsed using `FluentParser.parse_entry`.
+
+    This only looks at lines that are not indented, so entries with syntax
+    errors are not found until they are parsed. Parts of the source with lines
+    that are just an identifier are parsed to find the entries in them.
+    """
+    entries = []
+    entry_id, start = None, 0
+    for match in ENTRY_START_RE.finditer(source):
+        _add_scanned_entries(entries, source, entry_id, start, match.start())
+        entry_id, start = match.group(1), match.start()
+    _add_scanned_entries(entries, source, entry_id, start, len(source))
+    return entries
+
+
+def _add_scanned_entries(entries, source, entry_id, start, end):
+    if BARE_IDENTIFIER_RE.search(source, start, end) is None:
+        if entry_id is not None:
+            entries.append((entry_id, start, end))
+        return
+    resource = FluentParser().parse(source[start:end])
+    for item in resource.body:
+        if isinstance(item, (Message, Term)):
+            entries.append((ast_to_id(item), start + item.span.start, start + item.span.end))
+
+
 def native_to_fluent(val):
     """
     Convert a python type to a Fluent Type.
     """
-    if isinstance(val, int):
-        return FluentInt(val)
-    if isinstance(val, float):
-        return FluentFloat(val)
-    if isinstance(val, Decimal):
-        return FluentDecimal(val)
-
-    if isinstance(val, datetime):
-        return FluentDateTime.from_date_time(val)
-    if isinstance(val, date):
-        return FluentDate.from_date(val)
-    return val
+    try:
+        converter = _converters_by_type[type(val)]
+    except KeyError:
+        converter = _find_converter(type(val))
+    if converter is None:
+        return val
+    return converter(val)
+
+
+def _find_converter(cls):
+    converter = None
+    for base in cls.__mro__:
+        if base in NATIVE_TO_FLUENT:
+            converter = NATIVE_TO_FLUENT[base]
+            break
+    _converters_by_type[cls] = converter
+    return converter
+
+
+def register_converter(cls, converter):
+    """
+    Registers a function for converting values of type `cls` (and subclasses)
+    when they are passed as arguments to `FluentBundle.format`. The function
+    should return a string or a `FluentType` instance.
+    """
+    NATIVE_TO_FLUENT[cls] = converter
+    _converters_by_type.clear()
+
+
+class FluentArgs(dict):
+    """
+    The arguments passed to `FluentBundle.format`, converted to Fluent types
+    lazily, when they are first used. Callables without arguments can be
+    passed as argument values, and are only called if the argument is used.
+    """
+    __slots__ = ['native_args']
+
+    def __init__(self, native_args):
+        self.native_args = native_args
+
+    def __missing__(self, name):
+        val = self.native_args[name]
+        if callable(val):
+            val = val()
+        val = self[name] = native_to_fluent(val)
+        return val
 
 
 def reference_to_id(ref):
@@ -58,6 +153,30 @@ def reference_to_id(ref):
     return ref.id.name
 
 
+class _ReferenceCollector(Visitor):
+    def __init__(self):
+        self.references = set()
+
+    def visit_MessageReference(self, node):
+        self.references.add(reference_to_id(node))
+
+    visit_TermReference = visit_MessageReference
+
+    def visit_AttributeExpression(self, node):
+        # Depends on the whole message or term
+        self.visit(node.ref)
+
+
+def entry_references(entry):
+    """
+    Returns the set of ids of the messages and terms referenced by a Message
+    or Term AST node.
+    """
+    collector = _ReferenceCollector()
+    collector.visit(entry)
+    return collector.references
+
+
 def unknown_reference_error_obj(ref_id):
     if ATTRIBUTE_SEPARATOR in ref_id:
         return FluentReferenceError("Unknown attribute: {0}".format(ref_id))
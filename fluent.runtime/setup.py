@@ -22,7 +22,7 @@ setup(name='fluent.runtime',
       packages=['fluent', 'fluent.runtime'],
       install_requires=[
           'fluent.syntax>=0.12,<=0.13',
-          'attrs',
+          'attrs>=18.2.0',
           'babel',
           'pytz',
           'six',
@@ -1,8 +1,11 @@
+# -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
 import unittest
 
 from fluent.runtime import FluentBundle
+from fluent.runtime.types import fluent_number
+from fluent.runtime.utils import register_converter
 
 from ..utils import dedent_ftl
 
@@ -52,3 +55,55 @@ class TestStrings(unittest.TestCase):
         val, errs = self.ctx.format('foo', {'arg': 'Argument'})
         self.assertEqual(val, 'Argument')
         self.assertEqual(len(errs), 0)
+
+
+class TestArgumentConversion(unittest.TestCase):
+    def setUp(self):
+        self.ctx = FluentBundle(['en-US'], use_isolating=False)
+        self.ctx.add_messages(dedent_ftl("""
+            foo = Foo { $arg } { $arg }
+            bar = Bar
+            baz = Baz { $other }
+        """))
+
+    def test_callable_evaluated_once_when_used(self):
+        calls = []
+
+        def arg():
+            calls.append(1)
+            return 1234
+
+        val, errs = self.ctx.format('foo', {'arg': arg})
+        self.assertEqual(val, 'Foo 1,234 1,234')
+        self.assertEqual(len(errs), 0)
+        self.assertEqual(len(calls), 1)
+
+    def test_callable_not_evaluated_when_unused(self):
+        def arg():
+            raise AssertionError("Should not be called")
+
+        val, errs = self.ctx.format('baz', {'arg': arg, 'other': 'x'})
+        self.assertEqual(val, 'Baz x')
+        val, errs = self.ctx.format('bar', {'arg': arg})
+        self.assertEqual(val, 'Bar')
+
+    def test_custom_converter(self):
+        class Money(object):
+            def __init__(self, amount, currency):
+                self.amount = amount
+                self.currency = currency
+
+        class SpecialMoney(Money):
+            pass
+
+        # Money is local to this test, so registering it can't affect others.
+        register_converter(Money, lambda money: fluent_number(money.amount, style="currency",
+                                                              currency=money.currency))
+        val, errs = self.ctx.format('foo', {'arg': SpecialMoney(1.5, 'EUR')})
+        self.assertEqual(val, 'Foo €1.50 €1.50')
+        self.assertEqual(len(errs), 0)
+
+    def test_unconvertable(self):
+        val, errs = self.ctx.format('baz', {'other': object()})
+        self.assertEqual(val, 'Baz other')
+        self.assertEqual(len(errs), 1)
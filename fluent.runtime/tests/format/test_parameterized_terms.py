@@ -194,3 +194,54 @@ class TestMessagesCalledFromTerms(unittest.TestCase):
         val, errs = self.ctx.format('ref-foo', {'arg': 2})
         self.assertEqual(val, 'Msg is 1')
         self.assertEqual(errs, [])
+
+
+class TestTermInlining(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = FluentBundle(['en-US'], use_isolating=True)
+        self.ctx.add_messages(dedent_ftl("""
+            -brand = { $case ->
+                  *[nominative] Firefox
+                   [genitive] Firefoxu
+            }
+            -count = { $num ->
+                   [one] one
+                  *[other] { $num }
+            }
+            -product = { -brand } Browser
+            plain = About { -brand }
+            with-arg = About { -brand(case: "genitive") }
+            nested = About { -product }
+            number-arg = { -count(num: 1) }, { -count(num: 1000) }
+            -numbered = { NUMBER(1) } thing
+            function-term = About { -numbered }
+            missing = About { -missing }
+        """))
+
+    def test_constant_terms_inlined(self):
+        for message_id, expected in [
+            ('plain', 'About \u2068Firefox\u2069'),
+            ('with-arg', 'About \u2068Firefoxu\u2069'),
+            ('nested', 'About \u2068\u2068Firefox\u2069 Browser\u2069'),
+            ('number-arg', '\u2068one\u2069, \u20681,000\u2069'),
+        ]:
+            self.assertEqual(self.ctx.format(message_id), [expected, []])
+            self.assertIn(message_id, self.ctx._static_messages)
+
+    def test_non_constant_terms_not_inlined(self):
+        val, errs = self.ctx.format('function-term')
+        self.assertEqual(val, 'About \u2068\u20681\u2069 thing\u2069')
+        self.assertEqual(errs, [])
+        self.assertNotIn('function-term', self.ctx._static_messages)
+
+        val, errs = self.ctx.format('missing')
+        self.assertEqual(val, 'About \u2068-missing\u2069')
+        self.assertEqual(errs, [FluentReferenceError('Unknown term: -missing')])
+        self.assertNotIn('missing', self.ctx._static_messages)
+
+    def test_long_chain(self):
+        ctx = FluentBundle(['en-US'], use_isolating=False)
+        ctx.add_messages("".join("-m{0} = x{{ -m{1} }}\n".format(i, i + 1) for i in range(50))
+                         + "-m50 = end\nmessage = { -m0 }\n")
+        self.assertEqual(ctx.format('message'), ['x' * 50 + 'end', []])
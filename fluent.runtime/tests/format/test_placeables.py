@@ -109,3 +109,44 @@ class TestPlaceables(unittest.TestCase):
         val, errs = self.ctx.format('self-parent-ref-ok.attr', {})
         self.assertEqual(val, 'Attribute Parent')
         self.assertEqual(len(errs), 0)
+
+
+class TestConstantFolding(unittest.TestCase):
+    def setUp(self):
+        self.ctx = FluentBundle(['en-US'], use_isolating=False)
+        self.ctx.add_messages(dedent_ftl("""
+            app-name = My App
+                .short = App
+            section = Settings
+            title = { app-name } - { section } ({ app-name.short })
+            long-title = { title }!
+            number = Costs { 1234.5 }
+            mixed = { app-name }: { $count } { section }
+        """))
+
+    def test_static_references_folded(self):
+        self.assertEqual(self.ctx.format('title'), ['My App - Settings (App)', []])
+        self.assertIn('title', self.ctx._static_messages)
+
+    def test_only_one_level_folded(self):
+        self.assertEqual(self.ctx.format('long-title'), ['My App - Settings (App)!', []])
+        self.assertNotIn('long-title', self.ctx._static_messages)
+
+    def test_number_literal_folded(self):
+        self.assertEqual(self.ctx.format('number'), ['Costs 1,234.5', []])
+        self.assertIn('number', self.ctx._static_messages)
+
+    def test_adjacent_constants_merged(self):
+        self.assertEqual(self.ctx.format('mixed', {'count': 3}), ['My App: 3 Settings', []])
+        elements = self.ctx.lookup('mixed').elements
+        self.assertEqual([element(None) for element in (elements[0], elements[2])],
+                         ['My App: ', ' Settings'])
+        self.assertEqual(len(elements), 3)
+
+    def test_long_chain(self):
+        # Only a limited number of references are compiled while folding, so
+        # long chains don't run out of stack.
+        ctx = FluentBundle(['en-US'], use_isolating=False)
+        ctx.add_messages("".join("m{0} = x{{ m{1} }}\n".format(i, i + 1) for i in range(50))
+                         + "m50 = end\n")
+        self.assertEqual(ctx.format('m0'), ['x' * 50 + 'end', []])
@@ -215,3 +215,38 @@ class TestSelectExpressionWithTerms(unittest.TestCase):
         self.assertEqual(len(errs), 1)
         self.assertEqual(errs,
                          [FluentReferenceError('Unknown attribute: -my-term.missing')])
+
+
+class TestSelectExpressionDispatch(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = FluentBundle(['en-US'], use_isolating=False)
+        self.ctx.add_messages(dedent_ftl("""
+            mixed = { $arg ->
+                [one] Category one
+                [1] Exact 1
+                [0] Exact 0
+                [other] Category other
+               *[default] Default
+             }
+        """))
+        variants = "\n".join("    [c{0}] Country {0}".format(i) for i in range(250))
+        self.ctx.add_messages("countries = { $country ->\n" + variants + "\n   *[other] Unknown\n }\n")
+
+    def test_first_matching_variant_wins(self):
+        self.assertEqual(self.ctx.format('mixed', {'arg': 1})[0], 'Category one')
+        self.assertEqual(self.ctx.format('mixed', {'arg': 0})[0], 'Exact 0')
+        self.assertEqual(self.ctx.format('mixed', {'arg': 2})[0], 'Category other')
+        self.assertEqual(self.ctx.format('mixed', {'arg': 'one'})[0], 'Category one')
+        self.assertEqual(self.ctx.format('mixed', {'arg': 'default'})[0], 'Default')
+
+    def test_string_selector_matches_plural_category_of_number_key(self):
+        self.assertEqual(self.ctx.format('mixed', {'arg': 'other'})[0], 'Exact 0')
+
+    def test_many_variants(self):
+        for i in (0, 1, 125, 249):
+            val, errs = self.ctx.format('countries', {'country': 'c{0}'.format(i)})
+            self.assertEqual(val, 'Country {0}'.format(i))
+            self.assertEqual(errs, [])
+        self.assertEqual(self.ctx.format('countries', {'country': 'xx'})[0], 'Unknown')
+        self.assertEqual(self.ctx.format('countries', {'country': 5})[0], 'Unknown')
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, unicode_literals
 
+import threading
+import time
 import unittest
+from decimal import Decimal
+
+from fluent.syntax import ast as FTL
 
 from fluent.runtime import FluentBundle
+from fluent.runtime.errors import FluentReferenceError
+from fluent.runtime.locales import get_babel_locale, preload_locales
 
 from .utils import dedent_ftl
 
@@ -78,6 +85,26 @@ class TestFluentBundle(unittest.TestCase):
         self.assertEqual(ctx._plural_form(2),
                          'other')
 
+    def test_plural_form_memoized(self):
+        ctx = FluentBundle(['lv'])
+        rule = ctx._plural_form.rule
+        for number in [0, 1, 21, 9999, 10000, 10001, -1, 1.0, 0.1, 1.1, 11.1, Decimal('1.10'), Decimal('0.1')]:
+            for i in range(2):
+                self.assertEqual(ctx._plural_form(number), rule(number), number)
+
+    def test_locale_data_shared(self):
+        ctx1 = FluentBundle(['fr-CA'])
+        ctx2 = FluentBundle(['xx-XX', 'fr-CA'])
+        self.assertEqual(str(ctx1._babel_locale), 'fr_CA')
+        self.assertIs(ctx1._babel_locale, ctx2._babel_locale)
+        self.assertIs(ctx1._plural_form, ctx2._plural_form)
+
+    def test_preload_locales(self):
+        preload_locales(['de-AT', 'xx-XX'])
+        self.assertEqual(str(get_babel_locale('de-AT')), 'de_AT')
+        self.assertIsNone(get_babel_locale('xx-XX'))
+        self.assertIs(FluentBundle(['de-AT'])._babel_locale, get_babel_locale('de-AT'))
+
     def test_format_args(self):
         self.ctx.add_messages('foo = Foo')
         val, errs = self.ctx.format('foo')
@@ -110,3 +137,498 @@ class TestFluentBundle(unittest.TestCase):
         val, errs = self.ctx.format('foo', {})
         self.assertEqual(val, 'Refers to \u2068Foo\u2069')
         self.assertEqual(errs, [])
+
+    def test_format_static_message(self):
+        self.ctx.add_messages(dedent_ftl("""
+            foo = Foo
+                .attr = Foo Attribute
+            bar = { "Bar" }
+            -baz = Baz
+        """))
+        for i in range(2):
+            val, errs = self.ctx.format('foo', {'arg': 1})
+            self.assertEqual(val, 'Foo')
+            self.assertEqual(errs, [])
+            errs.append("Mutated by caller")
+        self.assertEqual(self.ctx.format('foo.attr'), ['Foo Attribute', []])
+        self.assertEqual(self.ctx.format('bar'), ['Bar', []])
+        self.assertEqual(sorted(self.ctx._static_messages.keys()), ['bar', 'foo', 'foo.attr'])
+        self.ctx.lookup('-baz')
+        self.assertRaises(LookupError, self.ctx.format, '-baz')
+
+    def test_reference_linking(self):
+        for compiler in ('resolver', 'codegen'):
+            ctx = FluentBundle(['en-US'], use_isolating=False, compiler=compiler)
+            ctx.add_messages(dedent_ftl("""
+                foo = Foo { bar } { -baz } { qux.attr }
+                -baz = Baz
+            """))
+            for i in range(2):
+                val, errs = ctx.format('foo')
+                self.assertEqual(val, 'Foo bar Baz qux.attr', compiler)
+                self.assertEqual(errs, [FluentReferenceError('Unknown message: bar'),
+                                        FluentReferenceError('Unknown attribute: qux.attr')])
+            ctx.add_messages(dedent_ftl("""
+                bar = Bar
+                qux = Qux
+            """))
+            self.assertEqual(ctx.format('foo'), ['Foo Bar Baz Qux', [
+                FluentReferenceError('Unknown attribute: qux.attr')]], compiler)
+            ctx.add_messages("-baz = Ignored duplicate\n")
+            self.assertEqual(ctx.format('foo'), ['Foo Bar Baz Qux', [
+                FluentReferenceError('Unknown attribute: qux.attr')]], compiler)
+
+    def test_environment_reused(self):
+        self.ctx.add_messages(dedent_ftl("""
+            foo = Foo { $arg }
+            outer = Outer { INNER() } { $arg }
+            -term = Term { $arg }{ NUMBER(0) }
+            uses-term = { -term } { -term(arg: 1) }
+        """))
+        self.ctx._functions['INNER'] = lambda: self.ctx.format('foo', {'arg': 'inner'})[0]
+        for i in range(2):
+            self.assertEqual(self.ctx.format('foo', {'arg': i}), ['Foo \u2068{0}\u2069'.format(i), []])
+            self.assertEqual(len(self.ctx._environments.free), 1)
+        # Formatting from inside a custom function uses a second environment
+        self.assertEqual(self.ctx.format('outer', {'arg': 'outer'}),
+                         ['Outer \u2068Foo \u2068inner\u2069\u2069 \u2068outer\u2069', []])
+        self.assertEqual(len(self.ctx._environments.free), 2)
+        self.assertEqual(self.ctx.format('uses-term', {'arg': 'x'}),
+                         ['\u2068Term \u2068arg\u2069\u20680\u2069\u2069 '
+                          '\u2068Term \u20681\u2069\u20680\u2069\u2069', []])
+
+    def test_compile_all(self):
+        self.ctx.add_messages(dedent_ftl("""
+            foo = Foo { $arg }
+                .attr = Attribute
+            -term = Term
+        """))
+        self.assertEqual(self.ctx.compile_stats().count, 0)
+        stats = self.ctx.compile_all()
+        self.assertEqual(stats.count, 2)
+        self.assertGreater(stats.time, 0)
+        self.assertEqual(sorted(self.ctx._compiled.keys()), ['-term', 'foo', 'foo.attr'])
+        self.ctx.format('foo')
+        self.assertRaises(LookupError, self.ctx.lookup, 'foo.missing')
+        self.assertEqual(self.ctx.compile_all(), stats)
+
+    def test_precompile(self):
+        source = dedent_ftl("""
+            foo = Foo { $arg }
+            bar = Bar { foo }
+        """)
+        eager = FluentBundle(['en-US'], precompile='eager')
+        eager.add_messages(source)
+        self.assertEqual(eager.compile_stats().count, 2)
+        self.assertEqual(sorted(eager._compiled.keys()), ['bar', 'foo'])
+
+        background = FluentBundle(['en-US'], precompile='background')
+        background.add_messages(source)
+        background.add_messages("baz = Baz\n")
+        # A single thread compiles the messages from both calls
+        self.assertLessEqual(len([thread for thread in threading.enumerate()
+                                  if thread.name == 'fluent-precompile']), 1)
+        background._precompile_queue.join()
+        self.assertEqual(background.compile_stats().count, 3)
+        self.assertEqual(background.format('bar', {'arg': 1}),
+                         ['Bar \u2068Foo \u20681\u2069\u2069', []])
+
+        self.assertRaises(ValueError, FluentBundle, ['en-US'], precompile='unknown')
+
+    def test_freeze(self):
+        for compiler in ('resolver', 'codegen'):
+            ctx = FluentBundle(['en-US'], use_isolating=False, compiler=compiler)
+            ctx.add_messages(dedent_ftl("""
+                foo = Foo { $arg }
+                    .attr = { foo } { missing }
+                -term = { $arg ->
+                    [a] A { NUMBER(1) }
+                   *[b] B
+                }
+                bar = { -term(arg: "a") } { foo.attr }
+            """))
+            ctx.freeze()
+            pattern = ctx.lookup('foo')
+            if compiler == 'codegen':
+                pattern = pattern.node
+            self.assertIsInstance(pattern.elements, tuple)
+
+            lookups = []
+            bundle_lookup = ctx.lookup
+
+            def lookup(full_id):
+                lookups.append(full_id)
+                return bundle_lookup(full_id)
+            ctx.lookup = lookup
+            for i in range(2):
+                val, errs = ctx.format('bar', {'arg': 1})
+                self.assertEqual(val, 'A 1 Foo 1 missing', compiler)
+                self.assertEqual(errs, [FluentReferenceError('Unknown message: missing')])
+            # Only the message itself is looked up, all references are linked
+            self.assertEqual(lookups, ['bar', 'bar'])
+            self.assertRaises(RuntimeError, ctx.add_messages, "baz = Baz")
+
+    def test_overlay(self):
+        for compiler in ('resolver', 'codegen'):
+            base = FluentBundle(['en-US'], use_isolating=False, compiler=compiler)
+            base.add_messages(dedent_ftl("""
+                -brand = Firefox
+                welcome = Welcome to { -brand }
+                about = About { welcome }
+                unrelated = Hello { $name }
+                    .title = Title
+                uses-missing = { tenant-only }
+                custom = { CUSTOM() }
+            """))
+            base.compile_all()
+            overlay = FluentBundle.overlay(
+                base,
+                functions={'CUSTOM': lambda: 'Custom'},
+                messages=dedent_ftl("""
+                    -brand = Tenant
+                    tenant-only = Tenant only
+                """))
+            self.assertEqual(overlay.format('about'), ['About Welcome to Tenant', []], compiler)
+            self.assertEqual(overlay.format('uses-missing'), ['Tenant only', []])
+            self.assertEqual(overlay.format('unrelated', {'name': 'Jane'}), ['Hello Jane', []])
+            self.assertEqual(overlay.format('custom'), ['Custom', []])
+            self.assertTrue(overlay.has_message('tenant-only'))
+            self.assertTrue(overlay.has_message('unrelated'))
+            self.assertEqual(list(overlay.get_message('unrelated').attributes), ['title'])
+            # Entries that don't depend on the overrides are shared
+            self.assertIs(overlay.lookup('unrelated'), base.lookup('unrelated'))
+            self.assertIs(overlay.lookup('unrelated.title'), base.lookup('unrelated.title'))
+            self.assertEqual(overlay.compile_all().count, 5)
+
+            # The base is unchanged
+            self.assertEqual(base.format('about'), ['About Welcome to Firefox', []])
+            self.assertEqual(base.format('uses-missing')[0], 'tenant-only')
+            self.assertFalse(base.has_message('tenant-only'))
+
+            # Overrides added later replace what was used before
+            overlay.add_messages("unrelated = Changed\n")
+            self.assertEqual(overlay.format('unrelated'), ['Changed', []])
+            self.assertRaises(LookupError, overlay.format, 'unrelated.title')
+
+    def test_overlay_use_isolating(self):
+        base = FluentBundle(['en-US'])
+        base.add_messages(dedent_ftl("""
+            foo = Foo { $arg }
+            bar = Bar { foo }
+        """))
+        overlay1 = FluentBundle.overlay(base, use_isolating=False)
+        overlay2 = FluentBundle.overlay(base, use_isolating=False, messages="foo = Tenant { $arg }\n")
+        self.assertEqual(overlay1.format('bar', {'arg': 1}), ['Bar Foo 1', []])
+        self.assertEqual(overlay2.format('bar', {'arg': 1}), ['Bar Tenant 1', []])
+        self.assertEqual(base.format('foo', {'arg': 1}), ['Foo \u20681\u2069', []])
+        # Entries compiled without isolation are shared by the overlays
+        self.assertIs(overlay1._base, overlay2._base)
+        self.assertIs(overlay1.lookup('foo'), overlay1._base.lookup('foo'))
+
+        self.assertRaises(ValueError, FluentBundle.overlay, FluentBundle(['en-US'], keep_ast=False))
+
+    def test_replace_messages(self):
+        for compiler in ('resolver', 'codegen'):
+            ctx = FluentBundle(['en-US'], use_isolating=False, compiler=compiler)
+            ctx.add_messages(dedent_ftl("""
+                -brand = Firefox
+                welcome = Welcome to { -brand }
+                about = About { welcome }
+                    .title = { -brand }
+                unrelated = Hello { $name }
+                uses-missing = { later }
+            """))
+            ctx.compile_all()
+            unrelated = ctx.lookup('unrelated')
+            self.assertEqual(ctx.format('about'), ['About Welcome to Firefox', []])
+
+            ctx.replace_messages(dedent_ftl("""
+                -brand = Nightly
+                later = Later
+            """))
+            self.assertEqual(ctx.format('about'), ['About Welcome to Nightly', []], compiler)
+            self.assertEqual(ctx.format('about.title'), ['Nightly', []])
+            self.assertEqual(ctx.format('uses-missing'), ['Later', []])
+            self.assertIs(ctx.lookup('unrelated'), unrelated)
+            self.assertEqual(sorted(ctx._get_dependents()['-brand']), ['about', 'welcome'])
+
+            ctx.replace_messages("welcome = Hi\n")
+            self.assertEqual(ctx.format('about'), ['About Hi', []])
+            self.assertEqual(ctx._get_dependents()['-brand'], set(['about']))
+            self.assertEqual(ctx.compile_all().count, 11)
+
+            ctx._remove_entries(['welcome'])
+            self.assertFalse(ctx.has_message('welcome'))
+            self.assertEqual(ctx.format('about'),
+                             ['About welcome', [FluentReferenceError('Unknown message: welcome')]])
+
+        ctx = FluentBundle(['en-US'], keep_ast=False)
+        self.assertRaises(ValueError, ctx.replace_messages, "foo = Foo\n")
+        ctx.add_messages("foo = Foo\nuses = Uses { foo }\n")
+        self.assertEqual(ctx.format('uses'), ['Uses \u2068Foo\u2069', []])
+        self.assertRaises(ValueError, ctx._remove_entries, ['foo'])
+        self.assertEqual(ctx.format('uses'), ['Uses \u2068Foo\u2069', []])
+
+    def test_replace_messages_while_compiling(self):
+        ctx = FluentBundle(['en-US'], use_isolating=False)
+        ctx.add_messages(dedent_ftl("""
+            foo = Old
+            bar = Bar { foo }
+        """))
+        compiler = ctx._compiler
+        compiling = threading.Event()
+
+        def slow_compiler(entry):
+            compiled = compiler(entry)
+            compiling.set()
+            time.sleep(0.05)
+            return compiled
+        ctx._compiler = slow_compiler
+
+        # 'bar' inlines the old text of 'foo', and neither must be stored
+        # after 'foo' is replaced
+        thread = threading.Thread(target=ctx.format, args=('bar',))
+        thread.start()
+        compiling.wait()
+        ctx.replace_messages("foo = New\n")
+        thread.join()
+        self.assertEqual(ctx.format('foo'), ['New', []])
+        self.assertEqual(ctx.format('bar'), ['Bar New', []])
+
+    def test_overlay_replace_messages(self):
+        base = FluentBundle(['en-US'], use_isolating=False)
+        base.add_messages(dedent_ftl("""
+            -brand = Firefox
+            welcome = Welcome to { -brand }
+            other = Other
+        """))
+        overlay = FluentBundle.overlay(base, messages="-brand = Tenant\n")
+        self.assertEqual(overlay.format('welcome'), ['Welcome to Tenant', []])
+        overlay.replace_messages("-brand = Changed\n")
+        self.assertEqual(overlay.format('welcome'), ['Welcome to Changed', []])
+        overlay._remove_entries(['-brand'])
+        self.assertEqual(overlay.format('welcome'), ['Welcome to Firefox', []])
+        self.assertIs(overlay.lookup('welcome'), base.lookup('welcome'))
+
+    def test_overlay_lazy_parse(self):
+        def parsed_ids(bundle):
+            return sorted(entry_id for entry_id, entry in bundle._messages_and_terms.items()
+                          if isinstance(entry, FTL.BaseNode))
+
+        base = FluentBundle(['en-US'], use_isolating=False, lazy_parse=True)
+        base.add_messages(dedent_ftl("""
+            -brand = Firefox
+            welcome = Welcome to { -brand }
+            about = About { welcome }
+            other = Other
+        """))
+        self.assertEqual(base.format('about'), ['About Welcome to Firefox', []])
+        base.add_messages("unused = Unused\n")
+        base.replace_messages("other = Changed\n")
+        # Building the reference graph doesn't parse anything
+        self.assertEqual(parsed_ids(base), ['-brand', 'about', 'welcome'])
+
+        base = FluentBundle(['en-US'], use_isolating=False, lazy_parse=True)
+        base.add_messages(dedent_ftl("""
+            -brand = Firefox
+            welcome = Welcome to { -brand }
+            about = About { welcome }
+            other = Other
+        """))
+        overlay = FluentBundle.overlay(base, messages="-brand = Tenant\n")
+        self.assertEqual(parsed_ids(base), [])
+        self.assertEqual(overlay.format('about'), ['About Welcome to Tenant', []])
+        self.assertEqual(overlay.format('other'), ['Other', []])
+        self.assertIs(overlay.lookup('other'), base.lookup('other'))
+        self.assertEqual(parsed_ids(base), ['about', 'other', 'welcome'])
+        self.assertEqual(base.format('about'), ['About Welcome to Firefox', []])
+
+    def test_lazy_parse(self):
+        ctx = FluentBundle(['en-US'], use_isolating=False, lazy_parse=True)
+        ctx.add_messages(dedent_ftl("""
+            # Comment
+            foo = Foo { $arg }
+                .attr = { -term }
+            -term = { $arg ->
+                [a] A
+               *[b] B
+            }
+            ## Group comment
+            broken = { $arg
+            bar = {
+            foo }
+            foo = Ignored duplicate
+            baz = { $arg
+            baz = Second definition
+        """))
+        self.assertEqual(sorted(ctx._messages_and_terms), ['-term', 'bar', 'baz', 'broken', 'foo'])
+        self.assertFalse(any(isinstance(entry, FTL.BaseNode)
+                             for entry in ctx._messages_and_terms.values()))
+
+        self.assertEqual(ctx.format('bar', {'arg': 1}), ['Foo 1', []])
+        self.assertEqual(ctx.format('foo.attr'), ['B', []])
+        self.assertIsInstance(ctx._messages_and_terms['-term'], FTL.Term)
+        self.assertIsNone(ctx._messages_and_terms['foo'].span)
+        # Syntax errors are only found when the entry is used
+        self.assertIn('broken', ctx._messages_and_terms)
+        self.assertRaises(LookupError, ctx.format, 'broken')
+        self.assertNotIn('broken', ctx._messages_and_terms)
+        # As with eager parsing, a later definition is used if the first one
+        # has syntax errors
+        self.assertEqual(ctx.format('baz'), ['Second definition', []])
+        self.assertEqual(ctx.compile_all().count, 4)
+
+    def test_lazy_parse_has_message(self):
+        ctx = FluentBundle(['en-US'], use_isolating=False, lazy_parse=True)
+        ctx.add_messages(dedent_ftl("""
+            broken = { $arg
+            foo = Foo
+            broken = { $arg ->
+            bar = Bar
+        """))
+        self.assertFalse(ctx.has_message('broken'))
+        self.assertRaises(LookupError, ctx.format, 'broken')
+        self.assertTrue(ctx.has_message('foo'))
+        # Only the entries asked about are parsed
+        self.assertEqual(sorted(ctx._messages_and_terms), ['bar', 'foo'])
+        self.assertNotIsInstance(ctx._messages_and_terms['bar'], FTL.BaseNode)
+
+    def test_lazy_parse_same_as_eager(self):
+        source = dedent_ftl("""
+            # Attributes without values, from fluent.syntax's syntax_zero_four.ftl
+            key1
+                .attr1 = Attr 1
+
+            key2
+                .attr1 = Attr 1
+                .attr2 = Attr 2
+            foo = {
+            key3
+            }
+            key3 = Key 3
+            standalone
+            -term
+                .attr = Term without a value
+        """)
+        eager = FluentBundle(['en-US'], use_isolating=False)
+        eager.add_messages(source)
+        lazy = FluentBundle(['en-US'], use_isolating=False, lazy_parse=True)
+        lazy.add_messages(source)
+        lazy.compile_all()
+        self.assertEqual(sorted(lazy._messages_and_terms), sorted(eager._messages_and_terms))
+        for message_id in ['key1.attr1', 'key2.attr1', 'key2.attr2', 'foo', 'key3']:
+            self.assertEqual(lazy.format(message_id), eager.format(message_id), message_id)
+
+    def test_keep_ast_false(self):
+        for compiler in ('resolver', 'codegen'):
+            ctx = FluentBundle(['en-US'], use_isolating=False, compiler=compiler, keep_ast=False)
+            ctx.add_messages(dedent_ftl("""
+                foo = Foo { $arg }
+                    .attr = { -term }
+                -term = Term
+                only-attrs =
+                    .attr = Attribute
+            """))
+            self.assertIsInstance(ctx._messages_and_terms['foo'], FTL.Message)
+            self.assertEqual(ctx.format('foo', {'arg': 1}), ['Foo 1', []])
+            self.assertEqual(ctx.format('foo.attr'), ['Term', []])
+            # The AST is released for compiled entries only
+            self.assertNotIsInstance(ctx._messages_and_terms['foo'], FTL.BaseNode)
+            self.assertIsInstance(ctx._messages_and_terms['only-attrs'], FTL.Message)
+            ctx.compile_all()
+            self.assertFalse(any(isinstance(entry, FTL.BaseNode)
+                                 for entry in ctx._messages_and_terms.values()))
+
+            self.assertTrue(ctx.has_message('foo'))
+            self.assertFalse(ctx.has_message('-term'))
+            message = ctx.get_message('foo')
+            self.assertEqual(list(message.attributes), ['attr'])
+            self.assertEqual(message.format({'arg': 2}), ['Foo 2', []])
+            self.assertRaises(LookupError, ctx.get_message('only-attrs').format)
+            self.assertEqual(ctx.format('only-attrs.attr'), ['Attribute', []])
+
+    def test_get_message(self):
+        self.ctx.add_messages(dedent_ftl("""
+            foo = Foo { $arg }
+                .attr = Foo Attribute
+                .other = Other { $arg }
+            bar = Bar
+            only-attrs =
+                .attr = Attribute
+            -baz = Baz
+        """))
+        foo = self.ctx.get_message('foo')
+        self.assertEqual(foo.id, 'foo')
+        for i in range(2):
+            self.assertEqual(foo.format({'arg': 'x'}), ['Foo \u2068x\u2069', []])
+        self.assertEqual(sorted(foo.attributes.keys()), ['attr', 'other'])
+        self.assertEqual(foo.attributes['attr'].format(), ['Foo Attribute', []])
+        self.assertEqual(foo.attributes['other'].format({'arg': 1}), ['Other \u20681\u2069', []])
+        self.assertEqual(self.ctx.get_message('foo.attr').format(), ['Foo Attribute', []])
+        self.assertEqual(self.ctx.get_message('bar').format(), ['Bar', []])
+
+        only_attrs = self.ctx.get_message('only-attrs')
+        self.assertRaises(LookupError, only_attrs.format)
+        self.assertEqual(only_attrs.attributes['attr'].format(), ['Attribute', []])
+
+        self.assertRaises(LookupError, self.ctx.get_message, 'missing')
+        self.assertRaises(LookupError, self.ctx.get_message, 'foo.missing')
+        self.assertRaises(LookupError, self.ctx.get_message, '-baz')
+
+    def test_format_many(self):
+        self.ctx.add_messages(dedent_ftl("""
+            foo = Foo
+                .attr = Foo Attribute
+            bar = Bar { $arg }
+            baz = Baz { $missing }
+        """))
+        args = {'arg': 1}
+        results = self.ctx.format_many(['foo', 'bar', ('bar', {'arg': 'x'}), 'foo.attr', ('baz', args), 'bar'],
+                                       args)
+        self.assertEqual(results, [
+            ['Foo', []],
+            ['Bar \u20681\u2069', []],
+            ['Bar \u2068x\u2069', []],
+            ['Foo Attribute', []],
+            ['Baz \u2068missing\u2069', [FluentReferenceError('Unknown external: missing')]],
+            ['Bar \u20681\u2069', []],
+        ])
+        self.assertEqual(self.ctx.format_many(['bar']), [['Bar \u2068arg\u2069',
+                                                          [FluentReferenceError('Unknown external: arg')]]])
+        self.assertRaises(LookupError, self.ctx.format_many, ['foo', 'missing'])
+
+    def test_format_batch(self):
+        self.ctx = FluentBundle(['en-US'], use_isolating=False)
+        self.ctx.add_messages(dedent_ftl("""
+            static = Static
+            items = { $name } has { $count ->
+                [one] one item
+               *[other] { $count } items
+            } costing { NUMBER($amount, minimumFractionDigits: 2) } { $currency }
+        """))
+        values, errors = self.ctx.format_batch('items', {
+            'name': ['Jane', 'John', 'Joe'],
+            'count': [1, 2, 1000],
+            'amount': [Decimal('1.5'), 2, 1234.5],
+        }, args={'currency': 'USD'})
+        self.assertEqual(values, ['Jane has one item costing 1.50 USD',
+                                  'John has 2 items costing 2.00 USD',
+                                  'Joe has 1,000 items costing 1,234.50 USD'])
+        self.assertEqual(errors, [[], [], []])
+
+        values, errors = self.ctx.format_batch('items', {'count': [1, 2]})
+        self.assertEqual(values[1], 'name has 2 items costing amount currency')
+        self.assertEqual(len(errors[1]), 3)
+
+        self.assertEqual(self.ctx.format_batch('static', {'x': [1, 2]}), [['Static', 'Static'], [[], []]])
+        self.assertRaises(ValueError, self.ctx.format_batch, 'items', {'name': ['a'], 'count': [1, 2]})
+        self.assertRaises(LookupError, self.ctx.format_batch, 'missing', {'count': [1]})
+
+    def test_format_batch_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            self.skipTest("numpy not installed")
+        self.ctx.add_messages("items = { $count -> \n [one] One\n *[other] Many\n }\n")
+        values, errors = self.ctx.format_batch('items', {'count': numpy.array([1, 5])})
+        self.assertEqual(values, ['One', 'Many'])
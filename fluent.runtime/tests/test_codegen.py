@@ -0,0 +1,184 @@
+from __future__ import absolute_import, unicode_literals
+
+import types
+import unittest
+from datetime import date
+from decimal import Decimal
+
+from fluent.runtime import FluentBundle
+from fluent.runtime.errors import FluentCyclicReferenceError
+from fluent.runtime.types import FluentNone, fluent_number
+
+from .utils import dedent_ftl
+
+FTL_CONTENT = dedent_ftl("""
+    -brand = Cool Thing
+        .gender = feminine
+    -thing = { $article ->
+          *[definite] the thing
+           [indefinite] a thing
+        }
+    -variants = {
+           *[nominative] Firefox
+            [genitive] Firefoxu
+        }
+
+    static = Static text
+    static-literal = { "A literal" }
+    static-number = { 123.4 }
+    long-literal = { "0123456789012345678901234567890123456789" }
+
+    arg = { $arg }
+    args = Hello { $name }, you have { $count } items
+    number-arg = { NUMBER($num, minimumFractionDigits: 2) }
+    date-arg = Today is { DATETIME($date, dateStyle: "long") }
+    unknown-function = { UNKNOWN($arg) }
+    raising-function = { RAISE() }
+    function-kwargs = { KWARGS(dashed-name: "x", other: 1) }
+
+    message-ref = Uses { static }
+    attribute-ref = Uses { with-attrs.title }
+    missing-attribute-ref = Uses { with-attrs.missing }
+    missing-message-ref = Uses { missing }
+    missing-term-ref = Uses { -missing }
+    with-attrs = With attributes
+        .title = Title for { $name }
+        .static = Static attribute
+    term-ref = Uses { -brand }
+    term-attr-select = { -brand.gender ->
+           [feminine] She
+          *[other] It
+        }
+    term-call = { -thing(article: "indefinite") }
+    term-call-positional = { -thing("foo") }
+    term-call-missing = { -missing(article: "definite") }
+    term-variant = { -variants[genitive] }
+    term-variant-missing = { -variants[missing] }
+
+    select-plural = { $count ->
+           [0] none
+           [one] one item
+          *[other] { $count } items
+        }
+    select-string = { $gender ->
+           [masculine] He
+           [feminine] She
+          *[other] They
+        }
+    select-mixed = { $count ->
+           [one] Category one
+           [1] Exact 1
+           [0] Exact 0
+           [masculine] Masculine
+           [other] Category other
+          *[default] Default
+        }
+    select-selector = { $gender ->
+           [0] Zero
+          *[default] Default
+        }
+    select-nested = { $count ->
+           [one] { $gender ->
+                  [feminine] one for her
+                 *[other] one for them
+               }
+          *[other] many
+        }
+
+    cyclic-1 = Text1 { cyclic-2 }
+    cyclic-2 = Text2 { cyclic-1 }
+    self-cyclic = Parent { self-cyclic.attr }
+        .attr = Attribute { self-cyclic }
+
+    lol0 = 01234567890123456789012345678901234567890123456789
+    lol1 = {lol0}{lol0}{lol0}{lol0}{lol0}{lol0}{lol0}{lol0}{lol0}{lol0}
+    lol2 = {lol1}{lol1}{lol1}{lol1}{lol1}{lol1}{lol1}{lol1}{lol1}{lol1}
+    lol3 = {lol2}{lol2}{lol2}{lol2}{lol2}{lol2}{lol2}{lol2}{lol2}{lol2}
+    lolz = {lol3}
+    elol0 = { "" }
+    elol1 = {elol0}{elol0}{elol0}{elol0}{elol0}{elol0}{elol0}{elol0}{elol0}{elol0}
+    elol2 = {elol1}{elol1}{elol1}{elol1}{elol1}{elol1}{elol1}{elol1}{elol1}{elol1}
+    elol3 = {elol2}{elol2}{elol2}{elol2}{elol2}{elol2}{elol2}{elol2}{elol2}{elol2}
+    elol4 = {elol3}{elol3}{elol3}{elol3}{elol3}{elol3}{elol3}{elol3}{elol3}{elol3}
+    emptylolz = {elol4}
+""")
+
+
+def RAISE():
+    raise ValueError("Raised")
+
+
+def KWARGS(**kwargs):
+    return ",".join(sorted(kwargs.keys()))
+
+
+FUNCTIONS = {'RAISE': RAISE, 'KWARGS': KWARGS}
+
+ARGS_LIST = [
+    None,
+    {},
+    {'arg': 'Text', 'name': 'Jane', 'count': 1, 'gender': 'feminine',
+     'num': Decimal('1.5'), 'date': date(2018, 2, 1)},
+    {'arg': 1.5, 'name': 'John', 'count': 0, 'gender': 'masculine',
+     'num': fluent_number(1234, useGrouping=False)},
+    {'arg': object(), 'count': 5, 'gender': 'other'},
+    {'count': FluentNone('x')},
+]
+
+
+class TestCodegen(unittest.TestCase):
+
+    def make_bundle(self, compiler, use_isolating, **kwargs):
+        bundle = FluentBundle(['en-US'], functions=FUNCTIONS,
+                              use_isolating=use_isolating, compiler=compiler, **kwargs)
+        bundle.add_messages(FTL_CONTENT)
+        return bundle
+
+    def assertSameOutput(self, use_isolating, **kwargs):
+        resolver_bundle = self.make_bundle('resolver', use_isolating)
+        codegen_bundle = self.make_bundle('codegen', use_isolating, **kwargs)
+        message_ids = []
+        for message_id, entry in resolver_bundle._messages_and_terms.items():
+            if resolver_bundle.has_message(message_id):
+                if entry.value is not None:
+                    message_ids.append(message_id)
+                message_ids.extend(message_id + '.' + attr.id.name
+                                   for attr in entry.attributes)
+        for message_id in message_ids:
+            for args in ARGS_LIST:
+                expected = resolver_bundle.format(message_id, args)
+                actual = codegen_bundle.format(message_id, args)
+                self.assertEqual(actual[0], expected[0], message_id)
+                self.assertEqual(type(actual[0]), type(expected[0]), message_id)
+                self.assertEqual([(type(e), e.args) for e in actual[1]],
+                                 [(type(e), e.args) for e in expected[1]],
+                                 message_id)
+
+    def test_same_output_isolating(self):
+        self.assertSameOutput(True)
+
+    def test_same_output_not_isolating(self):
+        self.assertSameOutput(False)
+
+    def test_same_output_lazy_parse(self):
+        self.assertSameOutput(True, lazy_parse=True)
+
+    def test_generates_functions(self):
+        bundle = self.make_bundle('codegen', False)
+        self.assertIsInstance(bundle.lookup('args'), types.FunctionType)
+        self.assertIn("''.join", bundle.lookup('args').source)
+
+    def test_cyclic_reference(self):
+        bundle = self.make_bundle('codegen', False)
+        val, errs = bundle.format('cyclic-1')
+        self.assertEqual(val, 'Text1 Text2 ???')
+        self.assertEqual(errs, [FluentCyclicReferenceError("Cyclic reference")])
+
+    def test_max_expansions_protection(self):
+        bundle = self.make_bundle('codegen', False)
+        val, errs = bundle.format('emptylolz')
+        self.assertEqual(val, '')
+        self.assertEqual(len(errs), 1)
+
+    def test_unknown_compiler(self):
+        self.assertRaises(ValueError, FluentBundle, ['en-US'], compiler='unknown')
@@ -0,0 +1,102 @@
+from __future__ import absolute_import, unicode_literals
+
+import gc
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from fluent.runtime import FluentBundle
+from fluent.runtime.fallback import FluentLocalization
+from fluent.runtime.loader import FluentResourceLoader
+
+from .utils import dedent_ftl
+
+
+class TestFluentLocalization(unittest.TestCase):
+
+    def setUp(self):
+        self.fr_ca = FluentBundle(['fr-CA'], use_isolating=False)
+        self.fr_ca.add_messages(dedent_ftl("""
+            colour = Couleur
+        """))
+        self.fr = FluentBundle(['fr'], use_isolating=False)
+        self.fr.add_messages(dedent_ftl("""
+            colour = Coleur
+            -brand = Firefox
+            welcome = Bienvenue dans { -brand }
+                .title = Titre
+        """))
+        self.en = FluentBundle(['en-US'], use_isolating=False)
+        self.en.add_messages(dedent_ftl("""
+            colour = Color
+            welcome = Welcome
+            only-english = Only English { $arg }
+        """))
+        self.l10n = FluentLocalization([self.fr_ca, self.fr, self.en])
+
+    def test_format(self):
+        self.assertEqual(self.l10n.locales, ['fr-CA', 'fr', 'en-US'])
+        self.assertEqual(self.l10n.format('colour'), ['Couleur', []])
+        self.assertEqual(self.l10n.format('welcome'), ['Bienvenue dans Firefox', []])
+        self.assertEqual(self.l10n.format('welcome.title'), ['Titre', []])
+        self.assertEqual(self.l10n.format('only-english', {'arg': 1}), ['Only English 1', []])
+        self.assertIs(self.l10n.bundle_for('welcome'), self.fr)
+        self.assertTrue(self.l10n.has_message('only-english'))
+        self.assertFalse(self.l10n.has_message('-brand'))
+        self.assertFalse(self.l10n.has_message('welcome.title'))
+        for missing in ['missing', '-brand', 'missing.attr', 'welcome.missing']:
+            self.assertRaises(LookupError, self.l10n.format, missing)
+
+    def test_bundles_changed(self):
+        self.fr.add_messages("only-english = Plus en anglais\n")
+        self.fr_ca.add_messages("-brand = Firefox Canada\n")
+        self.assertEqual(self.l10n.format('only-english'), ['Plus en anglais', []])
+        self.assertEqual(self.l10n.format('colour'), ['Couleur', []])
+
+        self.fr._remove_entries(['welcome', 'only-english'])
+        self.en._remove_entries(['only-english'])
+        self.assertEqual(self.l10n.format('welcome'), ['Welcome', []])
+        self.assertFalse(self.l10n.has_message('only-english'))
+
+    def test_lazy_parse_syntax_errors(self):
+        fr = FluentBundle(['fr'], use_isolating=False, lazy_parse=True)
+        fr.add_messages(dedent_ftl("""
+            colour = { $arg
+            welcome = { $arg
+            broken = { $arg
+        """))
+        l10n = FluentLocalization([fr, self.en])
+        self.assertEqual(l10n.format('colour'), ['Color', []])
+        self.assertIs(l10n.bundle_for('colour'), self.en)
+        self.assertTrue(l10n.has_message('welcome'))
+        self.assertIs(l10n.bundle_for('welcome'), self.en)
+        self.assertFalse(l10n.has_message('broken'))
+        self.assertRaises(LookupError, l10n.format, 'broken')
+
+    def test_not_kept_alive_by_bundles(self):
+        for i in range(10):
+            FluentLocalization([self.fr, self.en])
+        gc.collect()
+        self.assertEqual(len(self.en._listeners), 1)
+        self.en.add_messages("new = New\n")
+        self.assertEqual(self.l10n.format('new'), ['New', []])
+
+    def test_from_loader(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for locale, source in [('xx', "colour = Xx\nnumber = Xx { NUMBER(1234.5) }\n"),
+                               ('de', "colour = Farbe\n"),
+                               ('en-US', "number = Number { NUMBER(1234.5) }\nother = Other\n")]:
+            os.mkdir(os.path.join(tmpdir, locale))
+            with io.open(os.path.join(tmpdir, locale, 'main.ftl'), 'w', encoding='utf-8') as f:
+                f.write(source)
+        l10n = FluentLocalization.from_loader(FluentResourceLoader(tmpdir), ['xx', 'de', 'en-US'],
+                                              ['main.ftl'])
+        self.assertEqual(l10n.locales, ['xx', 'de', 'en-US'])
+        self.assertEqual(l10n.bundles[0].locales, ['xx', 'de', 'en-US'])
+        self.assertEqual(l10n.format('colour'), ['Xx', []])
+        # There is no locale data for 'xx', so German number formatting is used
+        self.assertEqual(l10n.format('number'), ['Xx \u20681.234,5\u2069', []])
+        self.assertEqual(l10n.format('other'), ['Other', []])
@@ -0,0 +1,165 @@
+from __future__ import absolute_import, unicode_literals
+
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from fluent.syntax import FluentParser
+
+from fluent.runtime import FluentBundle
+from fluent.runtime.errors import FluentReferenceError
+from fluent.runtime.loader import FluentFileLoader, FluentResourceLoader, ResourceCache, parser_version
+from fluent.runtime.snapshot import write_snapshot
+
+from .utils import dedent_ftl
+
+
+class TestFluentFileLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.bundle = FluentBundle(['en-US'], use_isolating=False)
+        self.brand_path = self.write('brand.ftl', "-brand = Firefox\n")
+        self.main_path = self.write('main.ftl', dedent_ftl("""
+            welcome = Welcome to { -brand }
+            other = Other
+        """))
+        self.loader = FluentFileLoader(self.bundle, [self.brand_path, self.main_path])
+
+    def write(self, name, source):
+        path = os.path.join(self.tmpdir, name)
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(source)
+        # Make sure the change is seen, even with coarse timestamps
+        mtime = time.time() + len(source)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_reload_changed(self):
+        self.assertEqual(self.loader.load(), [self.brand_path, self.main_path])
+        self.assertEqual(self.bundle.format('welcome'), ['Welcome to Firefox', []])
+        self.assertEqual(self.loader.reload_changed(), [])
+        other = self.bundle.lookup('other')
+
+        self.write('brand.ftl', "-brand = Nightly\n")
+        self.assertEqual(self.loader.reload_changed(), [self.brand_path])
+        self.assertEqual(self.bundle.format('welcome'), ['Welcome to Nightly', []])
+        self.assertIs(self.bundle.lookup('other'), other)
+
+        # Messages removed from files are removed from the bundle
+        self.write('main.ftl', "welcome = Hello from { -brand }\n")
+        self.assertEqual(self.loader.reload_changed(), [self.main_path])
+        self.assertEqual(self.bundle.format('welcome'), ['Hello from Nightly', []])
+        self.assertFalse(self.bundle.has_message('other'))
+
+        os.remove(self.brand_path)
+        self.assertEqual(self.loader.reload_changed(), [self.brand_path])
+        self.assertEqual(self.bundle.format('welcome'),
+                         ['Hello from -brand', [FluentReferenceError('Unknown term: -brand')]])
+
+    def test_keep_ast_false(self):
+        bundle = FluentBundle(['en-US'], keep_ast=False)
+        self.assertRaises(ValueError, FluentFileLoader, bundle, [self.brand_path, self.main_path])
+
+    def test_watch(self):
+        self.loader.load()
+        self.loader.watch(interval=0.01)
+        self.addCleanup(self.loader.stop)
+        self.write('brand.ftl', "-brand = Nightly\n")
+        for i in range(500):
+            if self.bundle.format('welcome')[0] == 'Welcome to Nightly':
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.bundle.format('welcome'), ['Welcome to Nightly', []])
+        self.loader.stop()
+        self.assertIsNone(self.loader._watch_thread)
+
+
+class TestFluentResourceLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.root = os.path.join(self.tmpdir, 'locales')
+        self.write('en-US/brand.ftl', "-brand = Firefox\n")
+        self.write('en-US/main.ftl', "welcome = Welcome to { -brand }\n")
+        self.write('en-US/app/menu.ftl', "menu-file = File\n")
+        self.write('en-US/README.txt', "Not FTL")
+        self.write('fr/brand.ftl', "-brand = Firefox\n")
+        self.write('fr/main.ftl', "welcome = Bienvenue dans { -brand }\n")
+        self.write('fr/empty.ftl', "")
+        self.loader = FluentResourceLoader(self.root)
+
+    def write(self, name, source):
+        path = os.path.join(self.root, *name.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(source)
+        mtime = time.time() + len(source)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_scanning(self):
+        self.assertEqual(self.loader.locales(), ['en-US', 'fr'])
+        self.assertEqual(self.loader.resource_ids('en-US'), ['app/menu.ftl', 'brand.ftl', 'main.ftl'])
+        self.assertEqual(self.loader.resource_ids('fr'), ['brand.ftl', 'empty.ftl', 'main.ftl'])
+        self.assertEqual(self.loader.resource_ids('de'), [])
+        self.assertEqual(self.loader.paths('fr', ['main.ftl', 'app/menu.ftl']),
+                         [os.path.join(self.root, 'fr', 'main.ftl')])
+
+    def test_bundle(self):
+        bundle = self.loader.bundle('fr', use_isolating=False)
+        self.assertEqual(bundle.locales, ['fr'])
+        self.assertEqual(bundle.format('welcome'), ['Bienvenue dans Firefox', []])
+        bundle = self.loader.bundle('en-US', ['main.ftl', 'brand.ftl'], use_isolating=False)
+        self.assertEqual(bundle.format('welcome'), ['Welcome to Firefox', []])
+        self.assertFalse(bundle.has_message('menu-file'))
+
+    def test_cache(self):
+        en_brand, en_main = self.loader.resources('en-US', ['brand.ftl', 'main.ftl'])
+        # Files with the same contents are only parsed once
+        fr_brand, fr_main = self.loader.resources('fr', ['brand.ftl', 'main.ftl'])
+        self.assertIs(fr_brand, en_brand)
+        self.assertIsNot(fr_main, en_main)
+        self.assertEqual(self.loader.cache.info().misses, 3)
+        self.assertIs(self.loader.resources('en-US', ['main.ftl'])[0], en_main)
+        self.assertEqual(self.loader.cache.info().misses, 3)
+
+        self.write('en-US/main.ftl', "welcome = Changed\n")
+        changed = self.loader.resources('en-US', ['main.ftl'])[0]
+        self.assertEqual(changed.body[0].value.elements[0].value, 'Changed')
+
+    def test_disk_cache(self):
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        os.mkdir(cache_dir)
+        loader = FluentResourceLoader(self.root, cache_dir=cache_dir)
+        resource = loader.resources('en-US', ['main.ftl'])[0]
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+        loaded = FluentResourceLoader(self.root, cache_dir=cache_dir).resources('en-US', ['main.ftl'])[0]
+        self.assertIsNot(loaded, resource)
+        self.assertTrue(loaded.equals(resource))
+
+        # Cached resources are used instead of parsing the file
+        with open(os.path.join(self.root, 'en-US', 'brand.ftl'), 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        cache_path = os.path.join(cache_dir, '{0}-{1}.pickle'.format(digest, parser_version()))
+        with open(cache_path, 'wb') as f:
+            write_snapshot(f, FluentParser().parse("-brand = From cache\n"))
+        brand_path = os.path.join(self.root, 'en-US', 'brand.ftl')
+        brand = ResourceCache(cache_dir=cache_dir).get(brand_path)
+        self.assertEqual(brand.body[0].value.elements[0].value, 'From cache')
+
+        # Anything else is ignored, and replaced
+        with open(cache_path, 'wb') as f:
+            write_snapshot(f, {'not': 'a resource'})
+        brand = ResourceCache(cache_dir=cache_dir).get(brand_path)
+        self.assertEqual(brand.body[0].value.elements[0].value, 'Firefox')
+        brand = ResourceCache(cache_dir=cache_dir).get(brand_path)
+        self.assertEqual(brand.body[0].value.elements[0].value, 'Firefox')
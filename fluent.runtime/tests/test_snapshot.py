@@ -0,0 +1,90 @@
+from __future__ import absolute_import, unicode_literals
+
+import io
+import unittest
+
+from fluent.runtime import FluentBundle
+from fluent.runtime.errors import FluentReferenceError
+from fluent.runtime.snapshot import SNAPSHOT_VERSION, SnapshotError
+from fluent.runtime.types import FluentNone
+
+from .test_codegen import ARGS_LIST, FTL_CONTENT, FUNCTIONS
+
+
+class TestSnapshot(unittest.TestCase):
+
+    compiler = 'resolver'
+
+    def make_bundle(self):
+        bundle = FluentBundle(['en-US'], functions=FUNCTIONS, compiler=self.compiler)
+        bundle.add_messages(FTL_CONTENT)
+        return bundle
+
+    def save(self, bundle):
+        fileobj = io.BytesIO()
+        bundle.save_snapshot(fileobj)
+        return fileobj.getvalue()
+
+    def test_round_trip(self):
+        bundle = self.make_bundle()
+        # Links made while formatting must not end up in the snapshot
+        bundle.format('message-ref')
+        loaded = FluentBundle.load_snapshot(io.BytesIO(self.save(bundle)), functions=FUNCTIONS)
+        self.assertEqual(loaded.compile_stats().count, 0)
+        self.assertEqual(loaded.locales, ['en-US'])
+        for message_id in sorted(bundle._compiled):
+            if message_id.startswith('-'):
+                continue
+            for args in ARGS_LIST:
+                actual = loaded.format(message_id, args)
+                expected = bundle.format(message_id, args)
+                self.assertEqual(actual[0], expected[0], message_id)
+                self.assertEqual([(type(e), e.args) for e in actual[1]],
+                                 [(type(e), e.args) for e in expected[1]],
+                                 message_id)
+        self.assertTrue(loaded.has_message('with-attrs'))
+        self.assertEqual(sorted(loaded.get_message('with-attrs').attributes), ['static', 'title'])
+
+    def test_snapshot_of_loaded_bundle(self):
+        data = self.save(self.make_bundle())
+        loaded = FluentBundle.load_snapshot(io.BytesIO(data), functions=FUNCTIONS)
+        reloaded = FluentBundle.load_snapshot(io.BytesIO(self.save(loaded)), functions=FUNCTIONS)
+        self.assertEqual(reloaded.format('args', {'name': 'Jane', 'count': 1}),
+                         ['Hello \u2068Jane\u2069, you have \u20681\u2069 items', []])
+
+    def test_without_ast(self):
+        bundle = FluentBundle(['en-US'], functions=FUNCTIONS, compiler=self.compiler, keep_ast=False)
+        bundle.add_messages(FTL_CONTENT)
+        loaded = FluentBundle.load_snapshot(io.BytesIO(self.save(bundle)), functions=FUNCTIONS)
+        self.assertEqual(loaded.format('args', {'name': 'Jane', 'count': 1}),
+                         ['Hello \u2068Jane\u2069, you have \u20681\u2069 items', []])
+        self.assertEqual(sorted(loaded.get_message('with-attrs').attributes), ['static', 'title'])
+
+    def test_overlay(self):
+        overlay = FluentBundle.overlay(self.make_bundle(), messages="static = Tenant\n")
+        loaded = FluentBundle.load_snapshot(io.BytesIO(self.save(overlay)), functions=FUNCTIONS)
+        self.assertEqual(loaded.format('message-ref'), ['Uses \u2068Tenant\u2069', []])
+        self.assertEqual(loaded.format('args', {'name': 'Jane', 'count': 1}),
+                         ['Hello \u2068Jane\u2069, you have \u20681\u2069 items', []])
+
+    def test_functions_not_saved(self):
+        loaded = FluentBundle.load_snapshot(io.BytesIO(self.save(self.make_bundle())))
+        val, errs = loaded.format('function-kwargs')
+        self.assertEqual(val, FluentNone('KWARGS()'))
+        self.assertEqual(errs, [FluentReferenceError('Unknown function: KWARGS')])
+
+    def test_invalid_snapshots(self):
+        data = self.save(self.make_bundle())
+        header, payload = data.split(b'\n', 1)
+        for invalid in [
+            b'',
+            b'not a snapshot\n' + payload,
+            header.replace(' {0} '.format(SNAPSHOT_VERSION).encode('ascii'), b' 0 ') + b'\n' + payload,
+            header + b'\n' + payload[:-1],
+        ]:
+            self.assertRaises(SnapshotError, FluentBundle.load_snapshot, io.BytesIO(invalid))
+
+
+class TestSnapshotCodegen(TestSnapshot):
+
+    compiler = 'codegen'
@@ -0,0 +1,93 @@
+from __future__ import absolute_import, unicode_literals
+
+import threading
+import time
+import unittest
+
+from fluent.runtime import FluentBundle
+
+from .utils import dedent_ftl
+
+THREAD_COUNT = 8
+
+
+class Rendezvous(object):
+    """
+    Blocks callers until `count` of them are waiting at the same time.
+    """
+    def __init__(self, count, timeout=5):
+        self.count = count
+        self.timeout = timeout
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def __call__(self):
+        deadline = time.time() + self.timeout
+        with self.condition:
+            self.waiting += 1
+            self.condition.notify_all()
+            while self.waiting < self.count:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return "timeout"
+                self.condition.wait(remaining)
+        return "ok"
+
+
+def run_threads(target, count=THREAD_COUNT):
+    results = [None] * count
+
+    def run(i):
+        results[i] = target()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class TestThreading(unittest.TestCase):
+
+    compiler = 'resolver'
+
+    def make_bundle(self, functions=None):
+        bundle = FluentBundle(['en-US'], use_isolating=False,
+                              functions=functions, compiler=self.compiler)
+        bundle.add_messages(dedent_ftl("""
+            -brand = Cool Thing
+            wait = Waited: { WAIT() }
+            outer = Outer { wait }
+            count = { $count ->
+                [one] One { -brand }
+               *[other] { $count } { -brand }s
+            }
+        """))
+        return bundle
+
+    def test_concurrent_format_of_same_message(self):
+        bundle = self.make_bundle(functions={'WAIT': Rendezvous(THREAD_COUNT)})
+        results = run_threads(lambda: bundle.format('outer'))
+        for val, errs in results:
+            self.assertEqual(val, 'Outer Waited: ok')
+            self.assertEqual(errs, [])
+
+    def test_stress(self):
+        bundle = self.make_bundle()
+
+        def format_many():
+            results = set()
+            for i in range(200):
+                for count in (1, 2):
+                    val, errs = bundle.format('count', {'count': count})
+                    results.add((val, len(errs)))
+            return results
+
+        for results in run_threads(format_many):
+            self.assertEqual(results, {('One Cool Thing', 0), ('2 Cool Things', 0)})
+
+
+class TestThreadingCodegen(TestThreading):
+
+    compiler = 'codegen'
@@ -9,7 +9,9 @@ from decimal import Decimal
 import pytz
 from babel import Locale
 
-from fluent.runtime.types import FluentDateType, FluentNumber, fluent_date, fluent_number
+from fluent.runtime import types
+from fluent.runtime.types import (FluentDateType, FluentNumber, fluent_date, fluent_number,
+                                  date_formatter_cache_info, number_pattern_cache_info)
 
 
 class TestFluentNumber(unittest.TestCase):
@@ -160,6 +162,20 @@ class TestFluentNumber(unittest.TestCase):
         self.assertEqual(f1.options.style, "decimal")
         self.assertEqual(FluentNumber.default_number_format_options.style, "decimal")
 
+    def test_pattern_cache(self):
+        types._number_pattern_cache.clear()
+        f1 = fluent_number(123456.78, minimumFractionDigits=3)
+        f2 = fluent_number(654321, minimumFractionDigits=3)
+        self.assertEqual(f1.format(self.locale), "123,456.780")
+        self.assertEqual(number_pattern_cache_info().misses, 1)
+        self.assertEqual(f2.format(self.locale), "654,321.000")
+        self.assertEqual(f1.format(self.locale), "123,456.780")
+        self.assertEqual(number_pattern_cache_info().hits, 2)
+
+        # Different locale must not re-use the pattern
+        self.assertEqual(f1.format(Locale.parse('de_DE')), "123.456,780")
+        self.assertEqual(number_pattern_cache_info().misses, 2)
+
 
 class TestFluentDate(unittest.TestCase):
 
@@ -270,6 +286,22 @@ class TestFluentDate(unittest.TestCase):
                            timeZone='Europe/London')
         self.assertEqual(fd2d.format(en_GB), '00:30')
 
+    def test_formatter_cache(self):
+        types._date_formatter_cache.clear()
+        en_GB = Locale('en', 'GB')
+        dt = datetime(2018, 7, 1, 23, 30, 0)
+        fd1 = fluent_date(dt, dateStyle='short', timeZone='Europe/London')
+        fd2 = fluent_date(datetime(2019, 1, 2, 3, 4, 5), dateStyle='short', timeZone='Europe/London')
+        self.assertEqual(fd1.format(en_GB), '02/07/2018')
+        self.assertEqual(fd2.format(en_GB), '02/01/2019')
+        self.assertEqual(fd1.format(en_GB), '02/07/2018')
+        self.assertEqual(date_formatter_cache_info().misses, 1)
+        self.assertEqual(date_formatter_cache_info().hits, 2)
+
+        self.assertEqual(fluent_date(dt, dateStyle='short').format(en_GB), '01/07/2018')
+        self.assertEqual(fd1.format(self.locale), '7/2/18')
+        self.assertEqual(date_formatter_cache_info().misses, 3)
+
     def test_allow_unsupported_options(self):
         # We are just checking that these don't raise exceptions
         with warnings.catch_warnings():
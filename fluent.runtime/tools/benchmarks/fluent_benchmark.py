@@ -4,6 +4,7 @@
 from __future__ import unicode_literals
 
 import sys
+import threading
 import pytest
 import six
 
@@ -47,10 +48,47 @@ def fluent_template(bundle):
     )
 
 
+def fluent_template_format_many(bundle):
+    results = bundle.format_many([
+        "one", "two", "three", "four", "five", "six",
+        ("seven", {"destination": "Mars"}),
+        "eight", "nine", "ten",
+    ])
+    return "preface" + "".join(val for val, errors in results) + "tail"
+
+
+def fluent_template_threaded(bundle, thread_count=8, iterations=100):
+    # Stress test a single bundle shared between many threads. This checks
+    # the output as well, to catch any unexpected interactions.
+    failures = []
+
+    def run():
+        for i in range(iterations):
+            if fluent_template(bundle) != EXPECTED_TEMPLATE_OUTPUT:
+                failures.append(i)
+
+    threads = [threading.Thread(target=run) for i in range(thread_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert failures == []
+
+
+EXPECTED_TEMPLATE_OUTPUT = "prefaceOneTwoThreeFourFiveSixSeven ways to MarsEightNineTentail"
+
+
 class TestBenchmark(object):
     def test_template(self, fluent_bundle, benchmark):
         result = benchmark(lambda: fluent_template(fluent_bundle))
 
+    def test_template_format_many(self, fluent_bundle, benchmark):
+        result = benchmark(lambda: fluent_template_format_many(fluent_bundle))
+        assert result == EXPECTED_TEMPLATE_OUTPUT
+
+    def test_template_threaded(self, fluent_bundle, benchmark):
+        benchmark(lambda: fluent_template_threaded(fluent_bundle))
+
     def test_bundle(self, benchmark):
         def test_bundles():
             FluentBundle(['pl'], use_isolating=False)
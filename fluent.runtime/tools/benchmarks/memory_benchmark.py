@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Measures the memory used by a FluentBundle, in bytes per message, after
+adding messages and after compiling them, and the time taken to add them.
+Requires Python 3. Run using:
+
+    $ python tools/benchmarks/memory_benchmark.py
+"""
+from __future__ import print_function, unicode_literals
+
+import gc
+import tracemalloc
+from timeit import default_timer
+
+from fluent.runtime import FluentBundle
+
+MESSAGE_COUNT = 5000
+
+
+def make_ftl(count):
+    messages = ["-brand = Firefox"]
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            messages.append("static-{0} = Some static text for message {0}".format(i))
+        elif kind == 1:
+            messages.append("args-{0} = Hello {{ $name }}, welcome to {{ -brand }}".format(i))
+        elif kind == 2:
+            messages.append(
+                "select-{0} = {{ $count ->\n"
+                "    [one] You have one new message\n"
+                "   *[other] You have {{ $count }} new messages\n"
+                "}}".format(i))
+        else:
+            messages.append(
+                "attrs-{0} = Button {0}\n"
+                "    .title = Title for {{ $name }}\n"
+                "    .accesskey = B".format(i))
+    return "\n".join(messages) + "\n"
+
+
+def measure(create):
+    """
+    Returns the object created by `create`, and the memory it uses
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = create()
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return result, used
+
+
+def main():
+    ftl = make_ftl(MESSAGE_COUNT)
+    # Load locale data first, so that it isn't counted
+    FluentBundle(['en-US']).add_messages("warmup = Warmup")
+
+    print("Bytes per message, for {0} messages".format(MESSAGE_COUNT))
+    for compiler in ['resolver', 'codegen']:
+        for keep_ast in [True, False]:
+            def add():
+                bundle = FluentBundle(['en-US'], compiler=compiler, keep_ast=keep_ast)
+                bundle.add_messages(ftl)
+                return bundle
+
+            def add_and_compile():
+                bundle = add()
+                bundle.compile_all()
+                return bundle
+
+            _, added = measure(add)
+            _, compiled = measure(add_and_compile)
+            print("{0:>8} compiler, keep_ast={1!s:5}: added {2:>6.0f}, compiled {3:>6.0f}".format(
+                compiler, keep_ast, added / MESSAGE_COUNT, compiled / MESSAGE_COUNT))
+
+    print()
+    for lazy_parse in [False, True]:
+        def add():
+            bundle = FluentBundle(['en-US'], lazy_parse=lazy_parse)
+            bundle.add_messages(ftl)
+            return bundle
+
+        _, added = measure(add)
+        start = default_timer()
+        add()
+        elapsed = default_timer() - start
+        print("lazy_parse={0!s:5}: added {1:>6.0f} bytes per message, in {2:.3f}s".format(
+            lazy_parse, added / MESSAGE_COUNT, elapsed))
+
+
+if __name__ == '__main__':
+    main()